@@ -1,13 +1,5 @@
-import logging
-import os
-import sys
-
-
-# Disable cs50 logger by default
-logging.getLogger("cs50").disabled = True
-
 # Import cs50_*
-from .cs50 import get_char, get_float, get_int, get_string
+from .cs50 import get_char, get_float, get_floats, get_int, get_ints, get_string, read_table, set_buffering
 
 try:
     from .cs50 import get_long
@@ -17,5 +9,19 @@ except ImportError:
 # Hook into flask importing
 from . import flask
 
-# Wrap SQLAlchemy
-from .sql import SQL
+
+def __getattr__(name):
+    """Lazily import SQL (and its exceptions) and ShardedSQL, since SQLAlchemy et al. are slow to import."""
+
+    # Wrap SQLAlchemy
+    if name in ["ResultTooLarge", "SQL", "StatementTimeout"]:
+        from . import sql
+
+        return getattr(sql, name)
+
+    # Shard SQL
+    if name == "ShardedSQL":
+        from .sharded import ShardedSQL
+
+        return ShardedSQL
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
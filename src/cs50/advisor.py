@@ -0,0 +1,379 @@
+"""
+Propose indexes for a SQLite database per a workload captured from SQL.execute, e.g.:
+
+    from cs50.advisor import capture
+    capture(db, "workload.jsonl")
+
+and then:
+
+    python -m cs50.advisor database.db workload.jsonl --validate
+"""
+
+import sys
+
+# Keywords that can follow a table's name in FROM, JOIN, or UPDATE, lest they be mistaken for aliases
+_KEYWORDS = {
+    "CROSS", "EXCEPT", "FULL", "GROUP", "HAVING", "INDEXED", "INNER", "INTERSECT", "JOIN", "LEFT", "LIMIT",
+    "NATURAL", "NOT", "OFFSET", "ON", "ORDER", "OUTER", "RETURNING", "RIGHT", "SET", "UNION", "USING", "WHERE",
+    "WINDOW",
+}
+
+# Commands whose plans might scan tables and that are replayed when validating proposals
+_COMMANDS = ["DELETE", "INSERT", "SELECT", "UPDATE"]
+
+
+def capture(db, path, *, redact=False):
+    """
+    Append a line of JSON to the file at path describing each statement that db, an instance of SQL, executes
+    successfully, with keys fingerprint, command, sql, args, kwargs, and seconds, whose values are replaced
+    with "?" if redact is True (and recorded as strs if not JSON-serializable). Returns the hook thereby
+    registered, so that it can be removed with db.remove_hook.
+    """
+
+    # Lazily import
+    import json
+    import threading
+
+    lock = threading.Lock()
+
+    def hook(event):
+        if event["exception"] is not None:
+            return
+        line = json.dumps({
+            "args": event["args"],
+            "command": event["command"],
+            "fingerprint": event["fingerprint"],
+            "kwargs": event["kwargs"],
+            "seconds": event["seconds"],
+            "sql": event["sql"],
+        }, default=str)
+        with lock, open(path, "a", encoding="utf-8") as file:
+            file.write(line + "\n")
+
+    return db.after_execute(hook, redact=redact)
+
+
+def advise(database, workload):
+    """
+    Run EXPLAIN QUERY PLAN for each statement in workload (the path of a file written by capture) against
+    the SQLite database at database, returning a list of proposed indexes, each a dict with keys statement
+    (a CREATE INDEX statement), name (thereof), table, columns, fingerprints (of the statements that would use
+    it), executions (thereof), and benefit (the number of rows that those executions would no longer scan or
+    sort, as estimated from the table's size), in descending order of benefit.
+    """
+
+    # Lazily import
+    import sqlite3
+
+    # Count executions of each fingerprint
+    executions = {}
+    for event in _load(workload):
+        if event["command"] in _COMMANDS:
+            executions[event["fingerprint"]] = executions.get(event["fingerprint"], 0) + 1
+
+    connection = sqlite3.connect(_uri(database), uri=True)
+    try:
+        proposals, rows = {}, {}
+        for fingerprint, n in executions.items():
+            for table, columns, saved in _candidates(connection, fingerprint, rows):
+                name = "idx_{}_{}".format(table, "_".join(columns))
+                proposal = proposals.setdefault((table, columns), {
+                    "benefit": 0,
+                    "columns": list(columns),
+                    "executions": 0,
+                    "fingerprints": [],
+                    "name": name,
+                    "statement": "CREATE INDEX {} ON {} ({})".format(
+                        _quote(name),
+                        _quote(table),
+                        ", ".join(_quote(column) for column in columns),
+                    ),
+                    "table": table,
+                })
+                proposal["benefit"] += saved * n
+                proposal["executions"] += n
+                proposal["fingerprints"].append(fingerprint)
+    finally:
+        connection.close()
+    return sorted(proposals.values(), key=lambda proposal: proposal["benefit"], reverse=True)
+
+
+def validate(database, workload, proposal, repeat=3):
+    """
+    Replay workload (the path of a file written by capture) against copies of the SQLite database at database,
+    without and with proposal (as returned by advise) applied, returning a dict with keys before and after
+    (the fewest seconds that a replay took, of repeat replays each) and used (whether the statements for which
+    the index was proposed now use it). The database itself is not modified.
+    """
+
+    # Lazily import
+    import os
+    import shutil
+    import sqlite3
+    import tempfile
+    from .sql import SQL
+
+    events = [event for event in _load(workload) if event["command"] in _COMMANDS]
+    source = SQL("sqlite:///" + _path(database), readonly=True)
+    directory = tempfile.mkdtemp(prefix="cs50-advisor-")
+    try:
+        result = {}
+        for when in ["before", "after"]:
+            seconds = []
+            for i in range(repeat):
+
+                # Copy database, applying proposal if after
+                path = os.path.join(directory, "{}-{}.db".format(when, i))
+                source.save_to(path)
+                connection = sqlite3.connect(path)
+                try:
+                    if when == "after":
+                        connection.execute(proposal["statement"])
+                        connection.execute("ANALYZE")
+                        result["used"] = False
+                        for fingerprint in proposal["fingerprints"]:
+                            try:
+                                plan = _plan(connection, fingerprint)
+                            except sqlite3.Error:  # E.g., if table since dropped
+                                continue
+                            if any("INDEX {}".format(proposal["name"]) in detail for detail in plan):
+                                result["used"] = True
+                                break
+                    else:
+                        connection.execute("ANALYZE")
+                    connection.commit()
+                finally:
+                    connection.close()
+
+                # Replay workload, ignoring errors (e.g., constraints violated by replayed INSERTs)
+                seconds.append(_replay(SQL("sqlite:///" + path), events))
+            result[when] = min(seconds)
+        return result
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main(argv=None):
+    """Print indexes proposed for a SQLite database per a captured workload, per python -m cs50.advisor -h."""
+
+    # Lazily import
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="python -m cs50.advisor",
+        description="Propose indexes for a SQLite database per a workload captured with cs50.advisor.capture.",
+    )
+    parser.add_argument("database", help="path of (or sqlite:/// URL for) SQLite database")
+    parser.add_argument("workload", help="path of file written by cs50.advisor.capture")
+    parser.add_argument("-n", "--top", type=int, default=10, help="number of proposals to print (default: 10)")
+    parser.add_argument("--validate", action="store_true", help="replay workload against a copy of database "
+                        "with and without each proposal")
+    args = parser.parse_args(argv)
+
+    proposals = advise(args.database, args.workload)
+    if not proposals:
+        print("No indexes to propose.")
+    for i, proposal in enumerate(proposals[: args.top], 1):
+        print("{}. {};".format(i, proposal["statement"]))
+        print("   benefit: {:,} rows over {:,} executions of {:,} statement(s)".format(
+            proposal["benefit"], proposal["executions"], len(proposal["fingerprints"])
+        ))
+        if args.validate:
+            result = validate(args.database, args.workload, proposal)
+            print("   replay: {:.3f}s before, {:.3f}s after, index {}".format(
+                result["before"], result["after"], "used" if result["used"] else "unused"
+            ))
+
+
+def _candidates(connection, fingerprint, rows):
+    """
+    Yield (table, columns, saved) for each table that fingerprint's plan scans (or sorts or indexes automatically)
+    and for which an index on columns (a tuple) could be searched instead, where saved is the number of rows
+    thereby no longer scanned or sorted per execution. Caches tables' sizes in rows.
+    """
+
+    # Lazily import
+    import re
+    import sqlite3
+    import warnings
+
+    # Plan
+    try:
+        plan = _plan(connection, fingerprint)
+    except sqlite3.Error as e:  # E.g., if table since dropped
+        warnings.warn("cannot plan {} ({})".format(fingerprint, e), RuntimeWarning)
+        return
+
+    # Unquote identifiers (e.g., "users"), as clauses are matched hereafter
+    statement = re.sub(r'["`\[](\w+)["`\]]', r"\1", fingerprint)
+
+    # Map tables' names and aliases to tables' names
+    names = {}
+    for matches in re.finditer(r"\b(?:FROM|JOIN|UPDATE) (\w+)(?: (?:AS )?(\w+))?", statement):
+        names[matches.group(1)] = matches.group(1)
+        if matches.group(2) and matches.group(2).upper() not in _KEYWORDS:
+            names[matches.group(2)] = matches.group(1)
+
+    # Scans, automatic indexes, and sorts
+    scans, automatic = [], []
+    for detail in plan:
+        matches = re.search(r"^SCAN (\w+)(?: USING (?:COVERING )?INDEX \w+)?$", detail)
+        if matches and matches.group(1) in names:
+            scans.append(names[matches.group(1)])
+        matches = re.search(r"^SEARCH (\w+) USING AUTOMATIC (?:PARTIAL )?(?:COVERING )?INDEX \((.+)\)$", detail)
+        if matches and matches.group(1) in names:
+            automatic.append((names[matches.group(1)], tuple(re.findall(r"(\w+)[=<>]", matches.group(2)))))
+    sort = "USE TEMP B-TREE FOR ORDER BY" in plan
+
+    # WHERE and ON, and ORDER BY, clauses
+    where = " AND ".join(re.findall(
+        r"\b(?:ON|WHERE) (.+?)(?= (?:CROSS |INNER |LEFT |NATURAL )?JOIN | WHERE | GROUP BY | HAVING | ORDER BY "
+        r"| LIMIT | RETURNING |$)",
+        statement,
+    ))
+    order = re.search(r"\bORDER BY (.+?)(?: LIMIT |$)", statement)
+    order = order.group(1).split(",") if order else []
+
+    for table in scans:
+        columns = _columns(connection, table)
+        aliases = [name for name in names if names[name] == table]
+
+        # Columns compared (or joined) with =, IN, or IS, and with <, >, or BETWEEN
+        equalities, ranges = [], []
+        for matches in re.finditer(r"(?:(\w+)\.)?(\w+) ?(==|=|<=|>=|<|>|IS NOT|IS|NOT IN|IN|BETWEEN)(?!\w)", where):
+            if matches.group(2) not in columns or (matches.group(1) and matches.group(1) not in aliases):
+                continue
+            if matches.group(3) in ["=", "==", "IS", "IN"]:
+                equalities.append(matches.group(2))
+            elif matches.group(3) in ["<", "<=", ">", ">=", "BETWEEN"]:
+                ranges.append(matches.group(2))
+        for matches in re.finditer(r"(?:==|=) ?(?:(\w+)\.)?(\w+)(?![\w.(])", where):  # E.g., ON u.id = o.user_id
+            if matches.group(2) in columns and (not matches.group(1) or matches.group(1) in aliases):
+                equalities.append(matches.group(2))
+
+        # Columns ordered by, if all of this table's and in the same direction
+        ordered = []
+        for term in order:
+            matches = re.search(r"^ ?(?:(\w+)\.)?(\w+)( ASC| DESC)? ?$", term)
+            if not matches or matches.group(2) not in columns or (matches.group(1) and matches.group(1) not in aliases):
+                ordered = []
+                break
+            ordered.append((matches.group(2), matches.group(3) == " DESC"))
+        if len(set(descending for column, descending in ordered)) > 1:
+            ordered = []
+
+        # Equalities, then ORDER BY if sorted (else first range)
+        candidate = list(dict.fromkeys(equalities))
+        if sort and ordered:
+            candidate += [column for column, descending in ordered if column not in candidate]
+        elif ranges:
+            candidate += [column for column in ranges[:1] if column not in candidate]
+        if not candidate or _indexed(connection, table, candidate):
+            continue
+        saved = _rows(connection, table, rows) * ((1 if equalities or ranges else 0) + (1 if sort and ordered else 0))
+        yield table, tuple(candidate), saved
+
+    # Automatic indexes, built (by scanning) for each execution
+    for table, columns in automatic:
+        if columns and not _indexed(connection, table, columns):
+            yield table, columns, _rows(connection, table, rows)
+
+
+def _columns(connection, table):
+    """Returns names of table's columns."""
+    return [row[1] for row in connection.execute("PRAGMA table_info({})".format(_quote(table)))]
+
+
+def _indexed(connection, table, columns):
+    """Returns whether an index on table already begins with columns."""
+    for index in connection.execute("PRAGMA index_list({})".format(_quote(table))).fetchall():
+        info = connection.execute("PRAGMA index_info({})".format(_quote(index[1]))).fetchall()
+        if [row[2] for row in sorted(info)][: len(columns)] == list(columns):
+            return True
+    return False
+
+
+def _load(path):
+    """Returns list of events in file at path, as written by capture."""
+
+    # Lazily import
+    import json
+
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def _path(database):
+    """Returns path of SQLite database, given its path or a sqlite:/// URL therefor."""
+    if database.startswith("sqlite:///"):
+        database = database[len("sqlite:///") :]
+    return database
+
+
+def _plan(connection, fingerprint):
+    """Returns details of fingerprint's plan, binding NULL to each of its placeholders."""
+    return [
+        row[3]
+        for row in connection.execute("EXPLAIN QUERY PLAN " + fingerprint, [None] * fingerprint.count("?"))
+    ]
+
+
+def _quote(identifier):
+    """Returns identifier, double-quoted if not alphanumeric."""
+
+    # Lazily import
+    import re
+
+    if re.search(r"^[A-Za-z_]\w*$", identifier):
+        return identifier
+    return '"{}"'.format(identifier.replace('"', '""'))
+
+
+def _replay(db, events):
+    """Execute each of events' statements with db, ignoring errors, returning how many seconds that took."""
+
+    # Lazily import
+    import time
+
+    start = time.perf_counter()
+    for event in events:
+        try:
+            db.execute(event["sql"], *event["args"], **event["kwargs"])
+        except (RuntimeError, ValueError):
+            pass
+    return time.perf_counter() - start
+
+
+def _rows(connection, table, rows):
+    """Returns (cached in rows) number of rows in table, per ANALYZE's statistics, if any, else COUNT(*)."""
+
+    # Lazily import
+    import sqlite3
+
+    if table not in rows:
+        try:
+            rows[table] = connection.execute(
+                "SELECT MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = ?", [table]
+            ).fetchone()[0]
+        except sqlite3.OperationalError:  # If not ANALYZEd
+            rows[table] = None
+        if rows[table] is None:
+            rows[table] = connection.execute("SELECT COUNT(*) FROM {}".format(_quote(table))).fetchone()[0]
+    return rows[table]
+
+
+def _uri(database):
+    """Returns URI with which to open SQLite database read-only."""
+
+    # Lazily import
+    import os
+    import urllib.parse
+
+    path = _path(database)
+    if not os.path.isfile(path):
+        raise RuntimeError("does not exist: {}".format(path))
+    return "file:{}?mode=ro".format(urllib.parse.quote(os.path.abspath(path)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
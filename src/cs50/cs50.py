@@ -1,47 +1,57 @@
 from __future__ import print_function
 
-import inspect
-import logging
 import os
-import re
 import sys
 
-from os.path import abspath, join
-from termcolor import colored
-from traceback import format_exception
 
+def _configure_logging():
+    """
+    Configure default logging handler and formatter, and cs50 logger, once, lazily, since
+    logging is slow to import.
+    """
 
-# Configure default logging handler and formatter
-# Prevent flask, werkzeug, etc from adding default handler
-logging.basicConfig(format="%(levelname)s: %(message)s", level=logging.DEBUG)
+    # Lazily import
+    import logging
 
-try:
-    # Patch formatException
-    logging.root.handlers[
-        0
-    ].formatter.formatException = lambda exc_info: _formatException(*exc_info)
-except IndexError:
-    pass
+    # If already configured
+    if getattr(_configure_logging, "configured", False):
+        return
+    _configure_logging.configured = True
 
-# Configure cs50 logger
-_logger = logging.getLogger("cs50")
-_logger.setLevel(logging.DEBUG)
+    # Prevent flask, werkzeug, etc from adding default handler
+    logging.basicConfig(format="%(levelname)s: %(message)s", level=logging.DEBUG)
+
+    try:
+        # Patch formatException
+        logging.root.handlers[
+            0
+        ].formatter.formatException = lambda exc_info: _formatException(*exc_info)
+    except IndexError:
+        pass
 
-# Log messages once
-_logger.propagate = False
+    # Configure cs50 logger
+    _logger = logging.getLogger("cs50")
+    _logger.setLevel(logging.DEBUG)
 
-handler = logging.StreamHandler()
-handler.setLevel(logging.DEBUG)
+    # Log messages once
+    _logger.propagate = False
 
-formatter = logging.Formatter("%(levelname)s: %(message)s")
-formatter.formatException = lambda exc_info: _formatException(*exc_info)
-handler.setFormatter(formatter)
-_logger.addHandler(handler)
+    handler = logging.StreamHandler()
+    handler.setLevel(logging.DEBUG)
+
+    formatter = logging.Formatter("%(levelname)s: %(message)s")
+    formatter.formatException = lambda exc_info: _formatException(*exc_info)
+    handler.setFormatter(formatter)
+    _logger.addHandler(handler)
+
+    # Disable cs50 logger by default
+    _logger.disabled = True
 
 
 class _Unbuffered:
     """
-    Disable buffering for standard output and standard error.
+    Disable buffering for standard output and standard error, unless
+    buffering is "line" (and stream is a TTY) or "block", per set_buffering.
 
     https://stackoverflow.com/a/107717
     https://docs.python.org/3/library/io.html
@@ -49,21 +59,64 @@ class _Unbuffered:
 
     def __init__(self, stream):
         self.stream = stream
+        try:
+            self.tty = stream.isatty()
+        except (AttributeError, ValueError):
+            self.tty = False
 
     def __getattr__(self, attr):
         return getattr(self.stream, attr)
 
     def write(self, b):
-        self.stream.write(b)
-        self.stream.flush()
+        n = self.stream.write(b)
+        if _buffering == "unbuffered" or (_buffering == "line" and self.tty and "\n" in b):
+            self.stream.flush()
+        return n
 
     def writelines(self, lines):
         self.stream.writelines(lines)
-        self.stream.flush()
+        if _buffering == "unbuffered" or (_buffering == "line" and self.tty):
+            self.stream.flush()
+
+
+def set_buffering(buffering):
+    """
+    Set buffering for standard output and standard error to "unbuffered"
+    (the default), to "line" (i.e., flush after each line ending if a TTY,
+    else when full), or to "block" (i.e., flush when full). Either way,
+    streams are flushed before input and upon exit. Defaults to value of
+    CS50_BUFFERING environment variable, if any.
+    """
+
+    # Lazily import
+    import atexit
+
+    global _buffering
+
+    if buffering not in ["block", "line", "unbuffered"]:
+        raise RuntimeError("invalid buffering: {}".format(buffering))
+    _buffering = buffering
+
+    # Flush anything buffered so far
+    sys.stdout.flush()
+    sys.stderr.flush()
 
+    # Flush upon exit
+    if buffering != "unbuffered" and not getattr(set_buffering, "registered", False):
+        atexit.register(sys.stdout.flush)
+        atexit.register(sys.stderr.flush)
+        set_buffering.registered = True
 
+
+_buffering = "unbuffered"
 sys.stderr = _Unbuffered(sys.stderr)
 sys.stdout = _Unbuffered(sys.stdout)
+if os.getenv("CS50_BUFFERING"):
+    try:
+        set_buffering(os.getenv("CS50_BUFFERING"))
+    except RuntimeError as e:  # Don't break import, but warn
+        import warnings
+        warnings.warn("{} (CS50_BUFFERING), defaulting to unbuffered".format(e), RuntimeWarning)
 
 
 def _formatException(type, value, tb):
@@ -74,6 +127,12 @@ def _formatException(type, value, tb):
     https://stackoverflow.com/a/46071447/5156190
     """
 
+    # Lazily import
+    import re
+    from os.path import abspath, join
+    from termcolor import colored
+    from traceback import format_exception
+
     # Absolute paths to site-packages
     packages = tuple(join(abspath(p), "") for p in sys.path[1:])
 
@@ -116,6 +175,9 @@ def get_float(prompt):
     as precisely as possible; if text does not represent a double, user is
     prompted to retry. If line can't be read, return None.
     """
+    # Lazily import
+    import re
+
     while True:
         s = get_string(prompt)
         if s is None:
@@ -127,12 +189,26 @@ def get_float(prompt):
                 pass
 
 
+def get_floats(n=None):
+    """
+    Read floats, separated by whitespace, from standard input until n
+    floats have been read (or until EOF, if n is None) and return them as
+    an array.array of doubles. Text that does not represent a double is
+    skipped, as by get_float. Reads standard input in large chunks, so
+    don't also read it with get_float, get_int, or get_string.
+    """
+    return _get_numbers(n, "d")
+
+
 def get_int(prompt):
     """
     Read a line of text from standard input and return the equivalent int;
     if text does not represent an int, user is prompted to retry. If line
     can't be read, return None.
     """
+    # Lazily import
+    import re
+
     while True:
         s = get_string(prompt)
         if s is None:
@@ -144,6 +220,18 @@ def get_int(prompt):
                 pass
 
 
+def get_ints(n=None):
+    """
+    Read ints, separated by whitespace, from standard input until n ints
+    have been read (or until EOF, if n is None) and return them as an
+    array.array of 64-bit ints (or as a list, if any int is too large for
+    64 bits). Text that does not represent an int is skipped, as by get_int.
+    Reads standard input in large chunks, so don't also read it with
+    get_float, get_int, or get_string.
+    """
+    return _get_numbers(n, "q")
+
+
 def get_string(prompt):
     """
     Read a line of text from standard input and return it as a string,
@@ -153,7 +241,180 @@ def get_string(prompt):
     """
     if not isinstance(prompt, str):
         raise TypeError("prompt must be of type str")
+
+    # Flush anything buffered before prompting
+    if _buffering != "unbuffered":
+        sys.stdout.flush()
+        sys.stderr.flush()
     try:
         return input(prompt)
     except EOFError:
         return None
+
+
+def read_table(types, sep=None):
+    """
+    Read lines of text from standard input until EOF, splitting each at sep
+    (or at whitespace, if sep is None) into columns of types, each of which
+    should be int, float, or str. Returns a list of columns, ints and floats
+    as an array.array each (as by get_ints and get_floats), strs as a list
+    each. Lines without as many columns as types, or whose columns do not
+    represent their types, are skipped.
+    """
+
+    # Lazily import
+    import array
+    import re
+
+    # Validate types
+    for type in types:
+        if type not in [float, int, str]:
+            raise TypeError("types must be int, float, or str")
+
+    # Patterns for fields and for whole columns (of fields separated by line endings), if any
+    patterns = [
+        re.compile(_PATTERNS["q" if type is int else "d"]) if type is not str else None
+        for type in types
+    ]
+    column_patterns = [
+        re.compile(rb"(?:%s\n)*%s" % (pattern.pattern, pattern.pattern)) if pattern else None
+        for pattern in patterns
+    ]
+
+    # Separator as bytes
+    if isinstance(sep, str):
+        sep = sep.encode(sys.stdin.encoding or "utf-8")
+
+    columns = [
+        array.array("q" if type is int else "d") if type is not str else []
+        for type in types
+    ]
+    for chunk in _read_chunks():
+        # Split lines into fields, skipping lines with too few or too many
+        rows = [
+            row
+            for row in (line.split(sep) for line in chunk.splitlines())
+            if len(row) == len(types)
+        ]
+
+        # If any invalid fields, skip their lines
+        if not all(
+            pattern is None or pattern.fullmatch(b"\n".join(column))
+            for pattern, column in zip(column_patterns, zip(*rows))
+        ):
+            rows = [
+                row
+                for row in rows
+                if all(
+                    pattern is None or pattern.fullmatch(field)
+                    for pattern, field in zip(patterns, row)
+                )
+            ]
+
+        # Convert columns
+        for i, column in enumerate(zip(*rows)):
+            if types[i] is str:
+                columns[i].extend(
+                    field.decode(sys.stdin.encoding or "utf-8") for field in column
+                )
+            else:
+                columns[i] = _append(columns[i], list(map(types[i], column)))
+    return columns
+
+
+# Text that represents an int ("q") or a float ("d"), per get_int and get_float
+_PATTERNS = {
+    "d": rb"[+-]?(?:\d+(?:\.\d*)?|\.\d+)",
+    "q": rb"[+-]?\d+",
+}
+
+# Bytes read from standard input but not yet consumed by get_floats, get_ints, or read_table
+_stdin = b""
+
+
+def _append(values, items):
+    """
+    Append items to values, an array.array, returning values, or a list
+    instead if any item is too large for the array.
+    """
+
+    # Lazily import
+    import array
+
+    if isinstance(values, array.array):
+        try:
+            values.extend(array.array(values.typecode, items))
+            return values
+        except OverflowError:
+            values = values.tolist()
+    values.extend(items)
+    return values
+
+
+def _get_numbers(n, typecode):
+    """Read up to n ints ("q") or floats ("d") from standard input, per get_ints and get_floats."""
+
+    # Lazily import
+    import array
+    import re
+
+    global _stdin
+
+    pattern = re.compile(_PATTERNS[typecode])
+
+    # Pattern for chunks wherein all text represents numbers
+    chunks = re.compile(
+        rb"\s*(?:%s\s+)*(?:%s\s*)?" % (_PATTERNS[typecode], _PATTERNS[typecode])
+    )
+
+    convert = int if typecode == "q" else float
+    values = array.array(typecode)
+    if n is not None and n <= 0:
+        return values
+    for chunk in _read_chunks():
+        # If chunk might have more numbers than needed, convert only as many as needed
+        if n is not None and len(values) + len(chunk.split()) >= n:
+            for match in re.finditer(rb"\S+", chunk):
+                if pattern.fullmatch(match.group()):
+                    values = _append(values, [convert(match.group())])
+                    if len(values) == n:
+                        _stdin = chunk[match.end() :] + _stdin
+                        return values
+
+        # If all text represents numbers, convert all at once
+        elif chunks.fullmatch(chunk):
+            values = _append(values, list(map(convert, chunk.split())))
+
+        # Skip text that does not represent numbers
+        else:
+            values = _append(
+                values,
+                [convert(token) for token in chunk.split() if pattern.fullmatch(token)],
+            )
+    return values
+
+
+def _read_chunks(size=65536):
+    """
+    Read standard input in chunks of about size bytes, yielding each chunk
+    through its last line ending (or through EOF), yielding any bytes not
+    yet consumed first.
+    """
+
+    global _stdin
+
+    while True:
+        data = sys.stdin.buffer.read1(size)
+        chunk, _stdin = _stdin + data, b""
+
+        # If EOF
+        if not data:
+            if chunk:
+                yield chunk
+            return
+
+        # Yield through last line ending, remembering rest
+        end = max(chunk.rfind(b"\n"), chunk.rfind(b"\r")) + 1
+        _stdin = chunk[end:]
+        if end > 0:
+            yield chunk[:end]
@@ -1,6 +1,9 @@
 import os
-import importlib.util
 import sys
+import weakref
+
+# Apps instrumented by instrument, referenced weakly, lest they never be garbage-collected
+_instrumented = weakref.WeakSet()
 
 
 def _wrap_flask(f):
@@ -8,7 +11,10 @@ def _wrap_flask(f):
         return
 
     from packaging.version import Version, InvalidVersion
-    from .cs50 import _formatException
+    from .cs50 import _configure_logging, _formatException
+
+    # Configure logging before Flask creates any loggers
+    _configure_logging()
 
     try:
         if Version(f.__version__) < Version("1.0"):
@@ -30,18 +36,182 @@ def _wrap_flask(f):
         f.Flask.__init__ = _flask_init_after
 
 
+def instrument(app, repeats=10):
+    """
+    Record how many SQL statements are executed during each of app's requests, how long they take
+    in total, and which is slowest, adding a Server-Timing header to each response. Logs a warning
+    if any statement, differing only in values, is executed more than repeats times in one request,
+    as might be because of an N+1 pattern.
+
+    https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Server-Timing
+    """
+
+    import flask
+
+    from . import sql
+
+    # Observe statements just once, for all instrumented apps, until all are garbage-collected
+    if app not in _instrumented:
+        _instrumented.add(app)
+        weakref.finalize(app, _uninstrument)
+    if _after_execute not in sql._after_execute:
+        sql._after_execute.append(_after_execute)
+
+    @app.after_request
+    def after_request(response):
+        statements = flask.g.pop("_cs50_statements", None)
+        if statements:
+            response.headers.add(
+                "Server-Timing",
+                'db;dur={:.3f};desc="{} statement{}", db-slowest;dur={:.3f}'.format(
+                    statements["seconds"] * 1000,
+                    statements["count"],
+                    "" if statements["count"] == 1 else "s",
+                    statements["slowest"]["seconds"] * 1000,
+                ),
+            )
+            flask.current_app.logger.debug(
+                "slowest statement (%.3f ms): %s",
+                statements["slowest"]["seconds"] * 1000,
+                statements["slowest"]["sql"],
+            )
+            for fingerprint, count in statements["fingerprints"].items():
+                if count > repeats:
+                    flask.current_app.logger.warning(
+                        "statement executed %d times in one request (N+1?): %s",
+                        count,
+                        fingerprint,
+                    )
+        return response
+
+    return app
+
+
+def _after_execute(event):
+    """Record statement described by event, if executed during a request to an instrumented app."""
+
+    import collections
+    import flask
+
+    if not flask.has_request_context() or flask.current_app._get_current_object() not in _instrumented:
+        return
+    if "_cs50_statements" not in flask.g:
+        flask.g._cs50_statements = {
+            "count": 0,
+            "fingerprints": collections.Counter(),
+            "seconds": 0.0,
+            "slowest": None,
+        }
+    statements = flask.g._cs50_statements
+    statements["count"] += 1
+    statements["fingerprints"][event["fingerprint"]] += 1
+    statements["seconds"] += event["seconds"]
+    if statements["slowest"] is None or event["seconds"] > statements["slowest"]["seconds"]:
+        statements["slowest"] = event
+
+
+def _uninstrument():
+    """Stop observing statements once no instrumented apps remain, so that SQL.execute needn't describe them."""
+
+    from . import sql
+
+    if not any(True for app in _instrumented) and _after_execute in sql._after_execute:
+        sql._after_execute.remove(_after_execute)
+
+
+def stream(db, sql, *args, format="json", size=1000, **kwargs):
+    """
+    Execute a SELECT with db, an instance of SQL, returning a chunked Response whose body is its rows,
+    as a JSON array (if format is "json") or as newline-delimited JSON (if format is "ndjson"), streamed
+    as they're fetched, size at a time, rather than all at once. Bytes are encoded as Base64, Decimals as
+    floats, and dates and times in ISO 8601. Raises (before responding) if the SELECT fails.
+    """
+
+    import flask
+    import itertools
+    import json
+
+    if format not in ["json", "ndjson"]:
+        raise RuntimeError("invalid format: {}".format(format))
+
+    # Fetch first rows now, lest SELECT fail only once responding
+    batches = db._stream(sql, args, kwargs, size)
+    first = next(batches, [])
+
+    def generate():
+        try:
+            separator = ""
+            if format == "json":
+                yield "["
+            for rows in itertools.chain([first], batches):
+                lines = [json.dumps(row, default=_default, separators=(",", ":")) for row in rows]
+                if format == "json":
+                    yield separator + ",".join(lines)
+                    separator = ","
+                else:
+                    yield "".join(line + "\n" for line in lines)
+            if format == "json":
+                yield "]"
+        finally:
+            batches.close()
+
+    return flask.Response(
+        generate(), mimetype="application/json" if format == "json" else "application/x-ndjson"
+    )
+
+
+def _default(value):
+    """Encode value as JSON, per stream, if bytes (as Base64), a Decimal (as a float), or a date or time (in ISO 8601)."""
+
+    import base64
+    import datetime
+    import decimal
+
+    if isinstance(value, (bytearray, bytes, memoryview)):
+        return base64.b64encode(value).decode("ascii")
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError("Object of type {} is not JSON serializable".format(type(value).__name__))
+
+
+class _FlaskFinder:
+    """
+    Wrap flask upon import, deferring search for flask's spec until then, since searching
+    sys.path is slow.
+
+    https://docs.python.org/3/reference/import.html#the-meta-path
+    """
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname != "flask":
+            return None
+
+        # Search for flask just once
+        sys.meta_path.remove(self)
+        for finder in sys.meta_path:
+            spec = finder.find_spec(fullname, path, target) if hasattr(finder, "find_spec") else None
+            if spec:
+                break
+        else:
+            return None
+
+        if spec.loader:
+            _exec_module_before = spec.loader.exec_module
+
+            def _exec_module_after(*args, **kwargs):
+                _exec_module_before(*args, **kwargs)
+                _wrap_flask(sys.modules["flask"])
+
+            spec.loader.exec_module = _exec_module_after
+        return spec
+
+
 # If Flask was imported before cs50
 if "flask" in sys.modules:
     _wrap_flask(sys.modules["flask"])
 
 # If Flask wasn't imported
 else:
-    spec = importlib.util.find_spec("flask")
-    if spec and spec.loader:
-        _exec_module_before = spec.loader.exec_module
-
-        def _exec_module_after(*args, **kwargs):
-            _exec_module_before(*args, **kwargs)
-            _wrap_flask(sys.modules["flask"])
-
-        spec.loader.exec_module = _exec_module_after
+    sys.meta_path.insert(0, _FlaskFinder())
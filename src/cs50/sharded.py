@@ -0,0 +1,206 @@
+from .sql import SQL, _parse
+
+# Default for ShardedSQL.execute's shard_key, since None is a valid key
+_MISSING = object()
+
+# Functions whose results, per shard, can't be merged
+_AGGREGATES = {
+    "ARRAY_AGG", "AVG", "BIT_AND", "BIT_OR", "BIT_XOR", "BOOL_AND", "BOOL_OR", "COUNT", "EVERY", "GROUP_CONCAT",
+    "JSON_AGG", "JSON_ARRAYAGG", "JSON_GROUP_ARRAY", "JSON_GROUP_OBJECT", "JSON_OBJECTAGG", "JSONB_AGG", "MAX",
+    "MIN", "STDDEV", "STRING_AGG", "SUM", "TOTAL", "VARIANCE",
+}
+
+
+class ShardedSQL(object):
+    """Shard statements across several databases (e.g., SQLite files), each wrapped by SQL."""
+
+    def __init__(self, urls, shard=None, **kwargs):
+        """
+        Create an instance of SQL for each of urls, passing it kwargs.
+
+        Shard should be a function that maps a shard key to the index of a shard in urls. By default,
+        ints are mapped modulo len(urls), and other keys are mapped by their CRC-32, likewise.
+        """
+
+        # Lazily import
+        import threading
+
+        if not urls:
+            raise RuntimeError("missing urls")
+        self._shards = [SQL(url, **kwargs) for url in urls]
+        self._shard = shard
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        """Returns number of shards."""
+        return len(self._shards)
+
+    def close(self):
+        """
+        Stop threads, if started, and close each shard, per SQL.close. This instance can still be used thereafter,
+        whereby they restart.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+        for shard in self._shards:
+            shard.close()
+
+    def shard(self, key):
+        """Returns instance of SQL for shard key's shard (e.g., so as to BEGIN a transaction therein)."""
+
+        # Lazily import
+        import zlib
+
+        if self._shard is not None:
+            index = self._shard(key)
+        elif isinstance(key, int) and not isinstance(key, bool):
+            index = key % len(self._shards)
+        else:
+            index = zlib.crc32(str(key).encode("utf-8")) % len(self._shards)
+        if not isinstance(index, int) or not 0 <= index < len(self._shards):
+            raise RuntimeError("invalid shard for key {!r}: {!r}".format(key, index))
+        return self._shards[index]
+
+    def execute(self, sql, *args, shard_key=_MISSING, **kwargs):
+        """
+        Execute a SQL statement on shard_key's shard, if passed, else on every shard, in parallel, outside of
+        transactions. If the latter, returns the rows of a SELECT from every shard, merged, sorted per its ORDER BY
+        (of result columns only) and limited per its LIMIT, if any, or the total number of rows matched by a DELETE
+        or UPDATE. INSERTs require a shard_key, as do SELECTs with aggregate functions, DISTINCT, GROUP BY,
+        HAVING, window functions, or UNION, INTERSECT, or EXCEPT, since each shard's rows can't be merged.
+        """
+
+        # Parse statement
+        parsed = _parse(sql)
+
+        # If shard key, execute on its shard, binding it too if a named placeholder is named shard_key
+        if shard_key is not _MISSING:
+            if "shard_key" in parsed.placeholders.values():
+                kwargs["shard_key"] = shard_key
+            return self.shard(shard_key).execute(sql, *args, **kwargs)
+
+        # Else scatter
+        if parsed.command == "INSERT":
+            raise RuntimeError("missing shard_key for INSERT")
+        if parsed.command in ["BEGIN", "COMMIT", "ROLLBACK", "START"]:
+            raise RuntimeError("missing shard_key for transaction")
+        if any(not shard._autocommit for shard in self._shards):
+            raise RuntimeError("cannot execute on every shard within a transaction")
+
+        # If SELECT, push down ORDER BY and LIMIT (sans OFFSET, sorting and limiting again after gathering)
+        order, limit, offset = [], None, 0
+        if parsed.command == "SELECT":
+            order, limit, offset, sql = _order_and_limit(sql)
+
+        # Gather
+        results = self._scatter(sql, args, kwargs)
+
+        # If SELECT, merge rows
+        if parsed.command == "SELECT":
+            rows = [row for result in results for row in result]
+            for column, descending in reversed(order):
+                try:
+                    rows.sort(
+                        key=lambda row: (row[column] is not None, row[column]),
+                        reverse=descending,
+                    )
+                except KeyError:
+                    raise RuntimeError("ORDER BY column not in result: {}".format(column))
+            return rows[offset:] if limit is None else rows[offset : offset + limit]
+
+        # If DELETE or UPDATE, sum number of rows matched
+        elif parsed.command in ["DELETE", "UPDATE"]:
+            return sum(results)
+
+        # Else return first shard's return value
+        return results[0]
+
+    def _scatter(self, sql, args, kwargs):
+        """Execute sql on every shard in parallel, returning their return values, else raising first exception."""
+
+        # Lazily import
+        import concurrent.futures
+
+        # Start threads, if not yet started
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=len(self._shards), thread_name_prefix="cs50-shard"
+                )
+
+        futures = [self._executor.submit(shard.execute, sql, *args, **kwargs) for shard in self._shards]
+        concurrent.futures.wait(futures)
+        return [future.result() for future in futures]
+
+
+def _order_and_limit(sql):
+    """
+    Parses sql's ORDER BY (of result columns) and LIMIT (and OFFSET), if any, returning a list of columns, each
+    with whether descending, the LIMIT (or None), the OFFSET (or 0), and sql with any OFFSET folded into its
+    LIMIT, so that each shard returns all rows that might be needed.
+    """
+
+    # Lazily import
+    import re
+    import sqlparse
+
+    # Reject top-level (i.e., not subqueries') clauses that would need rows from every shard at once
+    statement = sqlparse.parse(sqlparse.format(sql, strip_comments=True).strip().rstrip(";"))[0]
+    _check_mergeable(statement)
+
+    # Find top-level ORDER BY and LIMIT
+    tokens = statement.tokens
+    indexes = {}
+    for index, token in enumerate(tokens):
+        if token.ttype in sqlparse.tokens.Keyword and token.normalized in ["LIMIT", "ORDER BY"]:
+            indexes[token.normalized] = index
+    end = indexes.get("LIMIT", len(tokens))
+
+    # Parse ORDER BY
+    order = []
+    if "ORDER BY" in indexes:
+        clause = "".join(str(token) for token in tokens[indexes["ORDER BY"] + 1 : end])
+        for column in clause.split(","):
+            matches = re.search(r"^\s*(?:\w+\.)?(\w+)(?:\s+(ASC|DESC))?\s*$", column, re.IGNORECASE)
+            if not matches:
+                raise RuntimeError("cannot ORDER BY across shards: {}".format(column.strip()))
+            order.append((matches.group(1), (matches.group(2) or "").upper() == "DESC"))
+
+    # Parse LIMIT, a la LIMIT count, LIMIT count OFFSET offset, or LIMIT offset, count
+    if "LIMIT" not in indexes:
+        return order, None, 0, sql
+    clause = "".join(str(token) for token in tokens[indexes["LIMIT"] + 1 :])
+    matches = re.search(r"^\s*(\d+)\s*(?:(OFFSET|,)\s*(\d+)\s*)?$", clause, re.IGNORECASE)
+    if not matches:
+        raise RuntimeError("cannot LIMIT across shards: {}".format(clause.strip()))
+    limit, offset = int(matches.group(1)), int(matches.group(3) or 0)
+    if matches.group(2) == ",":
+        limit, offset = offset, limit
+    head = "".join(str(token) for token in tokens[: indexes["LIMIT"]])
+    return order, limit, offset, "{} LIMIT {:d}".format(head.rstrip(), limit + offset)
+
+
+def _check_mergeable(group):
+    """Raises RuntimeError if group, a parsed SELECT, has an aggregate, DISTINCT, GROUP BY, et al., outside of subqueries."""
+
+    # Lazily import
+    import sqlparse
+
+    for token in group.tokens:
+        if token.ttype in sqlparse.tokens.Keyword and token.normalized in [
+            "DISTINCT", "EXCEPT", "GROUP BY", "HAVING", "INTERSECT", "OVER", "UNION",
+        ]:
+            raise RuntimeError("cannot {} across shards".format(token.normalized))
+        if isinstance(token, sqlparse.sql.Function) and (token.get_real_name() or "").upper() in _AGGREGATES:
+            raise RuntimeError("cannot {}() across shards".format(token.get_real_name().upper()))
+        if token.is_group and not isinstance(token, sqlparse.sql.Parenthesis):
+            _check_mergeable(token)
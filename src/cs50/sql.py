@@ -1,8 +1,26 @@
+import collections.abc
+import contextlib
+import functools
+import io
 import sys
 import threading
+import weakref
 
-# Thread-local data
-_data = threading.local()
+from .cs50 import _configure_logging
+
+# Configure logging upon first use of SQL
+_configure_logging()
+
+# Engines, shared by instances of SQL with the same URL and options, and those already tested
+_engines = weakref.WeakValueDictionary()
+_engines_lock = threading.Lock()
+_tested = weakref.WeakSet()
+
+# Functions to call with a dict describing each statement after it's executed, as by cs50.flask.instrument
+_after_execute = []
+
+# Keyword arguments to SQL.execute that are options rather than named parameters
+_OPTIONS = {"max_bytes", "max_rows", "route", "timeout", "truncate"}
 
 
 def _enable_logging(f):
@@ -32,26 +50,171 @@ def _enable_logging(f):
     return decorator
 
 
+class StatementTimeout(RuntimeError):
+    """Raised when a statement takes longer than its timeout."""
+
+
+class ResultTooLarge(RuntimeError):
+    """Raised when a SELECT's result has more rows or bytes than allowed."""
+
+
 class SQL(object):
     """Wrap SQLAlchemy to provide a simple SQL API."""
 
-    def __init__(self, url, **kwargs):
+    def __init__(
+        self,
+        url,
+        *,
+        replicas=(),
+        balance="round_robin",
+        retries=0,
+        backoff=0.01,
+        busy_timeout=None,
+        readonly=False,
+        immutable=False,
+        mmap_size=None,
+        timeout=None,
+        max_rows=None,
+        max_bytes=None,
+        truncate=False,
+        group_commit=None,
+        check="eager",
+        warm=0,
+        **kwargs
+    ):
         """
         Create instance of sqlalchemy.engine.Engine.
 
         URL should be a string that indicates database dialect and connection arguments.
 
+        Replicas, if any, should be URLs of read-only copies of the same database, to which SELECTs
+        outside of transactions are routed, round-robin or to the least busy, per balance.
+
+        Statements that fail because the database is locked (or, for PostgreSQL and MySQL, because of a
+        serialization failure or deadlock) are retried up to retries times, after jittered, exponential
+        backoff starting at backoff seconds, if outside of a transaction or starting one. For SQLite,
+        busy_timeout, if not None, is how many seconds to wait for a lock before failing.
+
+        If readonly, statements that would write are rejected before they're executed. For SQLite, the database
+        is then opened with mode=ro and query_only, and statements outside of transactions aren't wrapped in
+        BEGIN and COMMIT. If immutable (which implies readonly), the database file is also assumed not to
+        change, even by other processes, so SQLite skips locking altogether. And mmap_size, if not None, is how
+        many bytes of a SQLite database to memory-map (by default, 256 MiB if readonly), so that processes share
+        the page cache.
+
+        Statements that take longer than timeout seconds, if not None, are interrupted, raising StatementTimeout.
+        Pass timeout to execute to override for just one statement.
+
+        SELECTs whose results have more than max_rows rows or max_bytes bytes (approximately, per the lengths of
+        values), if not None, raise ResultTooLarge, unless truncate, whereby just as many rows as fit are returned
+        in a list whose truncated attribute is True. Pass max_rows, max_bytes, or truncate to execute to override
+        for just one statement.
+
+        If group_commit is not None, DELETEs, INSERTs, and UPDATEs outside of transactions (and without timeouts)
+        are instead executed by a writer thread, which waits up to group_commit seconds (0, to wait not at all) for
+        more such statements from other threads, executing them all, plus any submitted while the previous batch
+        was executing, in a single transaction, so that they share one COMMIT (and, for SQLite, one fsync). Each
+        statement still returns or raises as usual, but only once its transaction is committed.
+
+        Engines (and their pools of connections) are shared by instances of SQL with the same URL and options.
+        Each is tested (and warmed with up to warm connections, if not 0), per check, now ("eager"), upon first
+        use ("lazy"), or in a background thread ("background"), whose exception, if any, is raised upon first use.
+
+        Each thread has its own connection to the primary, closed when the thread exits, upon close, or upon
+        exiting a with statement (e.g., with SQL(url) as db).
+
+        If URL is sqlite:///:memory: (or sqlite://), the database is instead in memory, shared by all of
+        this instance's connections, and can be loaded from or saved to a file with load_from and save_to.
+
         http://docs.sqlalchemy.org/en/latest/core/engines.html#sqlalchemy.create_engine
         http://docs.sqlalchemy.org/en/latest/dialects/index.html
         """
 
         # Lazily import
         import logging
+        import threading
+
+        # Validate balance
+        if balance not in ["least_busy", "round_robin"]:
+            raise RuntimeError("invalid balance: {}".format(balance))
+
+        # Validate check
+        if check not in ["background", "eager", "lazy"]:
+            raise RuntimeError("invalid check: {}".format(check))
+
+        # Get logger
+        self._logger = logging.getLogger("cs50")
+
+        # Remember options
+        self._backoff = backoff
+        self._busy_timeout = busy_timeout
+        self._retries = retries
+        self._timeout = timeout
+        self._max_rows = max_rows
+        self._max_bytes = max_bytes
+        self._truncate = truncate
+        self._readonly = readonly or immutable
+        self._immutable = immutable
+        self._mmap_size = mmap_size if mmap_size is not None or not self._readonly else 2**28
+
+        # Connections that keep in-memory databases alive, if any
+        self._keepalive = []
+
+        # Connections to primary, one per thread, each closed when its thread exits
+        self._connections = _Connections()
+        self._teardown = False
+
+        # Create (or reuse) engines
+        self._engine = self._create_engine(url, **kwargs)
+        self._replicas = [self._create_engine(replica, **kwargs) for replica in replicas]
+
+        # Test engines now, upon first use, or in background, per check
+        self._check = None
+        self._check_lock = threading.Lock()
+        self._warm = warm
+        if check == "eager":
+            self._test()
+        elif check == "lazy":
+            self._check = True
+        else:
+            self._check = threading.Thread(target=self._test, kwargs={"background": True}, daemon=True)
+            self._check.start()
+
+        # Track replicas' usage, for balancing
+        self._balance = balance
+        self._busy = [0] * len(self._replicas)
+        self._lock = threading.Lock()
+        self._turn = 0
+
+        # Statistics
+        self._statistics = {"lock_failures": 0, "retries": 0, "retry_seconds": 0.0, "timeouts": 0}
+
+        # Autocommit by default, each thread's transaction (if any) tracked per _autocommit
+        self._local = threading.local()
+
+        # Cache of schema, cleared upon changes thereto
+        self._schema = {}
+
+        # Hooks (and whether to redact values therefor), per before_execute and after_execute
+        self._hooks = {"after": [], "before": []}
+
+        # Writer thread, if grouping commits
+        self._group = None
+        if group_commit is not None:
+            if isinstance(group_commit, bool) or not isinstance(group_commit, (float, int)) or group_commit < 0:
+                raise RuntimeError("invalid group_commit: {}".format(group_commit))
+            self._group = _GroupCommit(self._engine, group_commit)
+
+    def _create_engine(self, url, **kwargs):
+        """Create instance of sqlalchemy.engine.Engine for URL, unless one already exists with the same options."""
+
+        # Lazily import
         import os
         import re
         import sqlalchemy
         import sqlalchemy.orm
-        import threading
+        import urllib.parse
+        import uuid
 
         # Temporary fix for missing sqlite3 module on the buildpack stack
         try:
@@ -59,29 +222,75 @@ class SQL(object):
         except:
             pass
 
+        # Share in-memory database among connections, keeping it alive for as long as this instance, via memdb VFS,
+        # whose locks (unlike a shared cache's, which fail with SQLITE_LOCKED) are waited for per busy timeout
+        # https://www.sqlite.org/inmemorydb.html
+        # https://www.sqlite.org/src/doc/tip/src/memdb.c
+        shared = True
+        if url in ["sqlite://", "sqlite:///:memory:"]:
+            shared = False
+            database = "file:/cs50-{}".format(uuid.uuid4().hex)
+            query = {"vfs": "memdb"}
+            if sqlite3.sqlite_version_info < (3, 36):  # Before memdb VFS, shared cache
+                database, query = "file:cs50-{}".format(uuid.uuid4().hex), {"cache": "shared", "mode": "memory"}
+            self._keepalive.append(sqlite3.connect(
+                database + "?" + urllib.parse.urlencode(query), uri=True, check_same_thread=False
+            ))
+            url = sqlalchemy.engine.URL.create("sqlite", database=database, query=dict(query, uri="true"))
+            kwargs["connect_args"] = dict({"check_same_thread": False}, **kwargs.get("connect_args", {}))
+            kwargs.setdefault("poolclass", sqlalchemy.pool.QueuePool)
+
         # Require that file already exist for SQLite
-        matches = re.search(r"^sqlite:///(.+)$", url)
+        key = (
+            str(url),
+            self._busy_timeout,
+            self._immutable,
+            self._mmap_size,
+            self._readonly,
+            repr(sorted(kwargs.items())),
+        )
+        matches = re.search(r"^sqlite:///(.+)$", url) if isinstance(url, str) else None
         if matches:
             if not os.path.exists(matches.group(1)):
                 raise RuntimeError("does not exist: {}".format(matches.group(1)))
             if not os.path.isfile(matches.group(1)):
                 raise RuntimeError("not a file: {}".format(matches.group(1)))
 
+            # Don't reuse engine for a file since replaced, lest its pool's connections be to the former file
+            stat = os.stat(matches.group(1))
+            key += (stat.st_dev, stat.st_ino)
+
+            # Open read-only (and, if immutable, without locking) via URI
+            # https://www.sqlite.org/uri.html
+            if self._readonly:
+                query = {"mode": "ro", "uri": "true"}
+                if self._immutable:
+                    query["immutable"] = "1"
+                url = sqlalchemy.engine.URL.create(
+                    "sqlite", database="file:" + urllib.parse.quote(matches.group(1)), query=query
+                )
+
+        # Reuse engine, if any
+        if shared:
+            with _engines_lock:
+                engine = _engines.get(key)
+            if engine is not None:
+                return engine
+
         # Create engine, disabling SQLAlchemy's own autocommit mode raising exception if back end's module not installed;
         # without isolation_level, PostgreSQL warns with "there is already a transaction in progress" for our own BEGIN and
         # "there is no transaction in progress" for our own COMMIT
-        self._engine = sqlalchemy.create_engine(url, **kwargs).execution_options(
+        engine = sqlalchemy.create_engine(url, **kwargs).execution_options(
             autocommit=False, isolation_level="AUTOCOMMIT", no_parameters=True
         )
 
         # Avoid doubly escaping percent signs, since no_parameters=True anyway
         # https://github.com/cs50/python-cs50/issues/171
-        self._engine.dialect.identifier_preparer._double_percents = False
+        engine.dialect.identifier_preparer._double_percents = False
 
-        # Get logger
-        self._logger = logging.getLogger("cs50")
+        # Listener for connections, with options of its own, since engine might outlive this instance
+        busy_timeout, readonly, mmap_size = self._busy_timeout, self._readonly, self._mmap_size
 
-        # Listener for connections
         def connect(dbapi_connection, connection_record):
             # Enable foreign key constraints
             try:
@@ -90,56 +299,2054 @@ class SQL(object):
                 ):  # If back end is sqlite
                     cursor = dbapi_connection.cursor()
                     cursor.execute("PRAGMA foreign_keys=ON")
+                    if busy_timeout is not None:
+                        cursor.execute(
+                            "PRAGMA busy_timeout={:d}".format(int(busy_timeout * 1000))
+                        )
+                    if readonly:
+                        cursor.execute("PRAGMA query_only=ON")
+                    if mmap_size is not None:
+                        cursor.execute("PRAGMA mmap_size={:d}".format(mmap_size))
                     cursor.close()
             except:
                 # Temporary fix for missing sqlite3 module on the buildpack stack
                 pass
 
         # Register listener
-        sqlalchemy.event.listen(self._engine, "connect", connect)
+        sqlalchemy.event.listen(engine, "connect", connect)
 
-        # Autocommit by default
-        self._autocommit = True
+        # Share engine, unless another thread has meanwhile
+        if shared:
+            with _engines_lock:
+                engine = _engines.setdefault(key, engine)
+        return engine
+
+    def _test(self, background=False):
+        """
+        Test engines not yet tested, warming each pool with up to warm connections. If background, remembers
+        exception, if any, for _checked to raise, rather than raising it.
+        """
+
+        # Lazily import
+        import sqlalchemy
 
-        # Test database
-        disabled = self._logger.disabled
-        self._logger.disabled = True
         try:
-            connection = self._engine.connect()
-            connection.execute(sqlalchemy.text("SELECT 1"))
-            connection.close()
-        except sqlalchemy.exc.OperationalError as e:
-            e = RuntimeError(_parse_exception(e))
-            e.__cause__ = None
-            raise e
-        finally:
-            self._logger.disabled = disabled
+            for engine in [self._engine] + self._replicas:
+                # Test database
+                if engine not in _tested:
+                    try:
+                        connection = engine.connect()
+                        connection.exec_driver_sql("SELECT 1")
+                        connection.close()
+                    except sqlalchemy.exc.OperationalError as e:
+                        e = RuntimeError(_parse_exception(e))
+                        e.__cause__ = None
+                        raise e
+                    _tested.add(engine)
+
+                # Warm pool
+                connections = [engine.connect() for _ in range(self._warm)]
+                for connection in connections:
+                    connection.close()
+        except Exception as e:
+            if not background:
+                raise
+            self._exception = e
+
+    def _checked(self):
+        """Test engines, if not yet tested, per check, or raise exception from background test, if any."""
+
+        # If tested
+        if self._check is None:
+            return
+
+        # Check (and update) atomically, lest threads race
+        with self._check_lock:
+            if self._check is None:
+                return
+
+            # If testing in background
+            if isinstance(self._check, threading.Thread):
+                self._check.join()
+                self._check = None
+                if getattr(self, "_exception", None) is not None:
+                    e, self._exception = self._exception, None
+                    self._check = True  # Test again upon next use
+                    raise e
+                return
+
+            # If testing upon first use
+            self._test()
+            self._check = None
 
     def __del__(self):
         """Disconnect from database."""
+        if getattr(self, "_connections", None) is not None:
+            self._connections.close()
+        if getattr(self, "_group", None) is not None:
+            self._group.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Close every thread's connection to database (rolling back any transaction therein) and stop writer
+        thread, if any. This instance can still be used thereafter, whereby it reconnects.
+        """
+        self._connections.close()
+        if self._group is not None:
+            self._group.stop()
+        self._autocommit = True
+
+    @property
+    def _autocommit(self):
+        """
+        Whether this thread is outside of a transaction, as it is if the connection on which it began one has
+        since been closed (e.g., upon error, by close, or by another thread).
+        """
+        transaction = getattr(self._local, "transaction", None)
+        return transaction is None or transaction is not self._connections.get()
+
+    @_autocommit.setter
+    def _autocommit(self, autocommit):
+        self._local.transaction = None if autocommit else self._connections.get()
+
+    def _disconnect(self):
+        """Close this thread's connection to primary, if any."""
+        connection = self._connections.pop()
+        if connection is not None:
+            connection.close()
+
+    def _connect(self):
+        """Returns this thread's connection to primary, connecting if not yet connected."""
+
+        # Test engines, if not yet tested
+        self._checked()
+
+        # If no connection yet, connect to database
+        connection = self._connections.get()
+        if connection is None:
+            connection = self._connections.set(self._engine.connect())
+
+        # Disconnect if/when a Flask app context is torn down, via signal (to which this instance is connected
+        # just once, and weakly), else via teardown function (which apps can't add once they've handled requests)
+        if not self._teardown:
+            try:
+                import flask
+
+                assert flask.current_app
+                try:
+                    flask.appcontext_tearing_down.connect(self._teardown_appcontext)
+                except RuntimeError:  # If blinker not installed
+                    flask.current_app.teardown_appcontext(self._teardown_appcontext)
+                self._teardown = True
+            except (ModuleNotFoundError, AssertionError):
+                pass
+
+        # Use this connection
+        return connection
+
+    def _teardown_appcontext(self, *args, **kwargs):
+        """Close this thread's connection to primary when a Flask app context is torn down."""
         self._disconnect()
 
-    def _disconnect(self):
-        """Close database connection."""
-        if hasattr(_data, self._name()):
-            getattr(_data, self._name()).close()
-            delattr(_data, self._name())
+    @contextlib.contextmanager
+    def _transaction(self):
+        """
+        Yields this thread's connection to primary within a transaction, BEGINning and then COMMITting (or
+        ROLLBACKing, upon exception) unless already within one.
+        """
+
+        # Lazily import
+        import sqlalchemy
+
+        connection = self._connect()
+
+        # If already within a transaction
+        if not self._autocommit:
+            yield connection
+            return
+
+        try:
+            connection.execute(sqlalchemy.text("BEGIN"))
+            yield connection
+            connection.execute(sqlalchemy.text("COMMIT"))
+        except:
+            try:
+                connection.execute(sqlalchemy.text("ROLLBACK"))
+            except sqlalchemy.exc.SQLAlchemyError:
+                pass
+            raise
+        finally:
+            self._disconnect()
+
+    @contextlib.contextmanager
+    def _timeout_after(self, connection, timeout):
+        """
+        Yields, interrupting statements executed on connection meanwhile after timeout seconds, if not None,
+        whereupon they raise sqlalchemy.exc.OperationalError, per _is_timeout.
+        """
+
+        # Lazily import
+        import sqlalchemy
+        import time
+
+        # If no timeout
+        if timeout is None:
+            yield
+            return
+
+        # Validate timeout
+        if isinstance(timeout, bool) or not isinstance(timeout, (float, int)) or timeout <= 0:
+            raise RuntimeError("invalid timeout: {}".format(timeout))
+
+        # If SQLite, interrupt via progress handler, called every 1000 virtual machine instructions
+        # https://www.sqlite.org/c3ref/progress_handler.html
+        backend = connection.dialect.name
+        if backend == "sqlite":
+            dbapi_connection = connection.connection.dbapi_connection
+            deadline = time.perf_counter() + timeout
+            dbapi_connection.set_progress_handler(lambda: time.perf_counter() > deadline, 1000)
+            try:
+                yield
+            finally:
+                dbapi_connection.set_progress_handler(None, 1000)
+            return
+
+        # If PostgreSQL or MySQL, set (and then reset) session's timeout in milliseconds
+        # https://www.postgresql.org/docs/current/runtime-config-client.html#GUC-STATEMENT-TIMEOUT
+        # https://dev.mysql.com/doc/refman/8.0/en/server-system-variables.html#sysvar_max_execution_time
+        if backend == "postgresql":
+            set_timeout = "SET statement_timeout = {:d}"
+            reset_timeout = "RESET statement_timeout"
+        elif backend == "mysql":
+            set_timeout = "SET SESSION max_execution_time = {:d}"
+            reset_timeout = "SET SESSION max_execution_time = DEFAULT"
+        else:
+            raise RuntimeError("timeouts not supported for {}".format(backend))
+        connection.exec_driver_sql(set_timeout.format(max(1, round(timeout * 1000))))
+        try:
+            yield
+        finally:
+            try:
+                connection.exec_driver_sql(reset_timeout)
+            except sqlalchemy.exc.DBAPIError:  # If transaction was aborted
+                connection.exec_driver_sql("ROLLBACK")
+                connection.exec_driver_sql(reset_timeout)
+
+    def execute(self, sql, *args, **kwargs):
+        """
+        Execute a SQL statement. Pass route="primary" or route="replica" to override where a SELECT is routed,
+        timeout to override how many seconds it may take, and max_rows, max_bytes, or truncate to override how
+        large its result may be.
+        """
+        return self._execute(_parse(sql), args, kwargs)
+
+    def before_execute(self, hook=None, *, redact=False):
+        """
+        Register hook, a function (or coroutine function), to be called with a dict describing each statement
+        before it's executed, with keys sql (the statement's template), fingerprint, command, args, and kwargs,
+        whose values are replaced with "?" if redact is True. Raising an exception in hook prevents execution.
+        Returns hook, so usable as a decorator, with or without arguments.
+        """
+        return self._register("before", hook, redact)
+
+    def after_execute(self, hook=None, *, redact=False):
+        """
+        Register hook, a function (or coroutine function), to be called with a dict describing each statement
+        after it's executed and its connection released, with the same keys as for before_execute plus seconds,
+        rowcount, and exception (if any, else None). Exceptions raised by hook are logged, not raised, since the
+        statement has already been executed. Returns hook, so usable as a decorator, with or without arguments.
+        """
+        return self._register("after", hook, redact)
+
+    def remove_hook(self, hook):
+        """Unregister hook, as registered with before_execute or after_execute."""
+        for when in self._hooks:
+            self._hooks[when] = [(h, r) for h, r in self._hooks[when] if h != hook]
+
+    def _register(self, when, hook, redact):
+        """Register hook to be called before or after, per when, each statement is executed."""
+
+        # If used as a decorator with arguments
+        if hook is None:
+            return lambda hook: self._register(when, hook, redact)
+
+        if not callable(hook):
+            raise RuntimeError("hook is not callable: {}".format(hook))
+        self._hooks[when] = self._hooks[when] + [(hook, redact)]
+        return hook
+
+    def _stream(self, sql, args, kwargs, size=1000):
+        """
+        Yields the rows of a SELECT (as dicts), up to size at a time, as they're fetched via a connection of its
+        own (from the primary), so that it can outlive this thread's (e.g., a Flask request's), without hooks.
+        Raises before yielding if the SELECT fails.
+        """
+
+        # Lazily import
+        import sqlalchemy
+
+        # Bind values
+        parsed = _parse(sql)
+        if parsed.command != "SELECT":
+            raise RuntimeError("not a SELECT: {}".format(parsed.sql))
+        if len(args) > 0 and len(kwargs) > 0:
+            raise RuntimeError("cannot pass both positional and named parameters")
+        values = parsed.values(args, kwargs, self._escape)
+        statement = "".join([str(token) for token in parsed.bind(values, self._escape)])
+
+        # Fetch rows via server-side cursor, if supported (as SQLite's cursors always stream), with PostgreSQL
+        # only within a transaction, lest psycopg2 reject the cursor in autocommit mode
+        self._checked()
+        connection = self._engine.connect()
+        try:
+            execution_options = {}
+            if self._engine.url.get_backend_name() != "sqlite":
+                execution_options["stream_results"] = True
+            try:
+                with _driver_transaction(connection, connection.dialect.name == "postgresql"):
+                    result = connection.execute(sqlalchemy.text(statement), execution_options=execution_options)
+                    while True:
+                        rows = result.mappings().fetchmany(size)
+                        if not rows:
+                            break
+                        yield [dict(row) for row in rows]
+                    result.close()
+            except (sqlalchemy.exc.OperationalError, sqlalchemy.exc.ProgrammingError) as e:
+                self._logger.error(statement)
+                e = RuntimeError(e.orig)
+                e.__cause__ = None
+                raise e
+        finally:
+            connection.close()
+
+    def loader(self, table, key="id", batch_size=500):
+        """
+        Returns a loader for rows of table by key, a column with a unique constraint, whose load(value) returns
+        a (lazy) row, a read-only dict-like object, that's only selected when first accessed, together with every
+        other row loaded (but not yet selected) by this thread (or, with Flask, during this request), via one
+        SELECT with WHERE key IN (...) per batch_size values. With Flask, rows are cached for the rest of the
+        request. Rows that don't exist are empty (and thus falsy).
+        """
+
+        # Lazily import
+        import re
+
+        if not isinstance(batch_size, int) or batch_size < 1:
+            raise RuntimeError("invalid batch size: {}".format(batch_size))
+        for identifier in [table, key]:
+            if not isinstance(identifier, str) or not re.search(r"^\w+$", identifier):
+                raise RuntimeError("invalid identifier: {}".format(identifier))
+        return _Loader(self, table, key, batch_size)
+
+    def prepare(self, sql):
+        """
+        Parse a SQL statement once, returning a callable that executes it with values for its placeholders,
+        e.g., prepare("SELECT * FROM users WHERE id = ?")(42). With SQLite, values are bound by the driver
+        itself, whose cache of compiled statements is thus reused.
+        """
+        return _PreparedStatement(self, _Statement(sql))
+
+    @_enable_logging
+    def _execute(self, parsed, args, kwargs, prepared=False):
+        """Execute a parsed SQL statement with values for its placeholders, calling hooks, if any."""
+
+        # Separate options from named parameters, unless named placeholders
+        kwargs = dict(kwargs)
+        options = {
+            name: kwargs.pop(name)
+            for name in _OPTIONS & kwargs.keys()
+            if name not in parsed.placeholders.values()
+        }
+
+        # Ensure named and positional parameters are mutually exclusive
+        if len(args) > 0 and len(kwargs) > 0:
+            raise RuntimeError("cannot pass both positional and named parameters")
+
+        # Validate values
+        values = parsed.values(args, kwargs, self._escape)
+        command = parsed.command
+
+        # Reject writes early, if read-only
+        self._check_writable(parsed)
+
+        # If prepared for SQLite (or binary data for SQLite, lest it be escaped as hex), bind values via driver
+        parameters = None
+        if self._engine.url.get_backend_name() == "sqlite" and (
+            prepared or any(isinstance(value, bytes) for value in values.values())
+        ):
+            parameters = parsed.parameters(values)
+
+        # Else escape values (or, if logging, escape values anyway)
+        tokens = None
+        if parameters is None or not self._logger.disabled:
+            tokens = parsed.bind(values, self._escape)
+
+        # Join tokens into statement
+        statement = None
+        if parameters is None:
+            statement = "".join([str(token) for token in tokens])
+
+        # If no hooks, just execute statement
+        if not (self._hooks["before"] or self._hooks["after"] or _after_execute):
+            return self._run(parsed, statement, parameters, tokens, options)[0]
+
+        # Else execute statement, calling hooks
+        with self._hooked(parsed.sql, args, kwargs, parsed) as event:
+            ret, event["rowcount"] = self._run(parsed, statement, parameters, tokens, options)
+            return ret
+
+    def _check_writable(self, parsed):
+        """Raises RuntimeError if read-only and parsed statement (might) write."""
+        if self._readonly and (
+            parsed.command in ["DELETE", "INSERT", "UPDATE", "VACUUM", "CREATE VIEW"]
+            or parsed.full_statement.startswith(("ALTER", "CREATE", "DROP", "REPLACE"))
+        ):
+            raise RuntimeError("cannot write to read-only database: {}".format(parsed.sql))
+
+    @contextlib.contextmanager
+    def _hooked(self, sql, args=(), kwargs=None, parsed=None):
+        """
+        Calls before_execute hooks with a dict describing statement sql (parsed, if not already), yielding it (so
+        that its rowcount can be set) for the statement to be executed, timing it, and then calls observers and
+        after_execute hooks. If none, just yields a dict.
+        """
+
+        # Lazily import
+        import logging
+        import time
+
+        # If no hooks
+        if not (self._hooks["before"] or self._hooks["after"] or _after_execute):
+            yield {}
+            return
+
+        # Describe statement for hooks
+        if parsed is None:
+            try:
+                parsed = _parse(sql)
+            except RuntimeError:  # E.g., a trigger that SQLite deems one statement but sqlparse deems two
+                pass
+        event = {
+            "args": args,
+            "command": parsed.command if parsed is not None else None,
+            "exception": None,
+            "fingerprint": parsed.fingerprint if parsed is not None else sql,
+            "kwargs": kwargs if kwargs is not None else {},
+            "rowcount": None,
+            "seconds": None,
+            "sql": sql,
+        }
+        for hook, redact in self._hooks["before"]:
+            _call_hook(hook, event, redact)
+
+        # Execute statement, timing it
+        start = time.perf_counter()
+        try:
+            yield event
+        except Exception as e:
+            event["exception"] = e
+            raise
+
+        # Notify observers and hooks, if any, after disconnecting, logging (rather than raising) their exceptions,
+        # lest a statement that succeeded (e.g., a committed INSERT) seem to have failed, via a logger of their own,
+        # since cs50's is disabled by default
+        finally:
+            event["seconds"] = time.perf_counter() - start
+            for observer in list(_after_execute):
+                try:
+                    observer(event)
+                except Exception:
+                    logging.getLogger("cs50.hooks").exception("exception in observer {!r}".format(observer))
+            for hook, redact in self._hooks["after"]:
+                try:
+                    _call_hook(hook, event, redact)
+                except Exception:
+                    logging.getLogger("cs50.hooks").exception("exception in after_execute hook {!r}".format(hook))
+
+    def _run(self, parsed, statement, parameters, tokens, options):
+        """
+        Execute a parsed, bound SQL statement (or, if parameters is not None, its driver_sql with
+        parameters), returning its return value and its number of rows.
+        """
+
+        # Lazily import
+        import decimal
+        import sqlalchemy
+        import termcolor
+        import warnings
+
+        command = parsed.command
+
+        # Test engines, if not yet tested
+        self._checked()
+
+        # Choose primary or replica
+        replica = self._route(command, options.get("route"))
+
+        # If grouping commits, have writer thread execute write (outside of a transaction) within a shared one
+        if (
+            self._group is not None
+            and command in ["DELETE", "INSERT", "UPDATE"]
+            and self._autocommit
+            and options.get("timeout", self._timeout) is None
+        ):
+            _statement = _abbreviate(parsed, tokens)
+            try:
+                ret, rowcount = self._group.submit(parsed, statement, parameters)
+            except (RuntimeError, ValueError):
+                self._logger.error(termcolor.colored(_statement, "red"))
+                raise
+            self._logger.info(termcolor.colored(_statement, "green"))
+            return ret, rowcount
+
+        # If replica, connect to it just for this statement
+        if replica is not None:
+            try:
+                connection = self._replicas[replica].connect()
+            except:
+                self._release(replica)
+                raise
+
+        # Use primary
+        else:
+            connection = self._connect()
+
+        # Catch SQLAlchemy warnings
+        with warnings.catch_warnings():
+            # Raise exceptions for warnings
+            warnings.simplefilter("error")
+
+            # Prepare, execute statement
+            try:
+                # Join tokens into statement, abbreviating binary data as <class 'bytes'>
+                _statement = _abbreviate(parsed, tokens)
+
+                # Safe to retry if outside of a transaction or starting one
+                retries = self._retries if self._autocommit else 0
+
+                # Limits on result's size, if any, in which case stream results from server, if supported
+                max_rows = options.get("max_rows", self._max_rows)
+                max_bytes = options.get("max_bytes", self._max_bytes)
+                for name, limit in [("max_bytes", max_bytes), ("max_rows", max_rows)]:
+                    if limit is not None and (isinstance(limit, bool) or not isinstance(limit, int) or limit < 0):
+                        raise RuntimeError("invalid {}: {}".format(name, limit))
+                execution_options = {}
+                driver_transaction = False
+                if (max_rows is not None or max_bytes is not None) and connection.dialect.name != "sqlite":
+                    # With PostgreSQL, only outside of transactions, within one begun by driver itself (since
+                    # psycopg2 rejects server-side cursors in autocommit mode), else fetch all rows from server
+                    if connection.dialect.name != "postgresql":
+                        execution_options["stream_results"] = True
+                    elif self._autocommit and command == "SELECT":
+                        execution_options["stream_results"] = driver_transaction = True
+
+                # Check for start of transaction
+                if command in ["BEGIN", "START", "VACUUM"]:  # cannot VACUUM from within a transaction
+                    self._autocommit = False
+
+                # Execute statement, retrying if locked, BEGINning and COMMITting via driver, since faster than text,
+                # unless read-only, whereby statements can't conflict
+                transact = self._autocommit and not self._readonly and not driver_transaction
+                with self._timeout_after(connection, options.get("timeout", self._timeout)):
+                    for attempt in range(retries + 1):
+                        try:
+                            with _driver_transaction(connection, driver_transaction):
+                                if transact:
+                                    connection.exec_driver_sql("BEGIN")
+                                if parameters is None:
+                                    result = connection.execute(
+                                        sqlalchemy.text(statement), execution_options=execution_options
+                                    )
+                                else:
+                                    result = connection.exec_driver_sql(
+                                        parsed.driver_sql, parameters, execution_options=execution_options
+                                    )
+                                if command == "SELECT":  # Before COMMITting, lest streamed results be closed
+                                    rows, truncated = _fetch(result, max_rows, max_bytes)
+                                    if "stream_results" in execution_options:  # Close cursor, even if unexhausted
+                                        result.close()
+                                if transact:
+                                    connection.exec_driver_sql("COMMIT")
+                            break
+                        except sqlalchemy.exc.OperationalError as e:
+                            if attempt == retries or not _is_locked(e):
+                                raise
+                            if transact:
+                                try:
+                                    connection.execute(sqlalchemy.text("ROLLBACK"))
+                                except sqlalchemy.exc.OperationalError:  # If BEGIN itself failed
+                                    pass
+                            self._backoff_for(attempt)
+
+                # Number of rows
+                rowcount = result.rowcount
+
+                # Clear cached schema if (possibly) changed
+                if parsed.full_statement.startswith(("ALTER", "CREATE", "DROP", "ROLLBACK")):
+                    self._schema.clear()
+
+                # Check for end of transaction
+                if command in ["COMMIT", "ROLLBACK", "VACUUM"]:  # cannot VACUUM from within a transaction
+                    self._autocommit = True
+
+                # Return value
+                ret = True
+
+                # If SELECT, return result set as list of dict objects
+                if command == "SELECT":
+                    # If too large
+                    if truncated and not options.get("truncate", self._truncate):
+                        if self._autocommit:
+                            self._disconnect()
+                        raise ResultTooLarge(
+                            "result too large (max_rows={}, max_bytes={})".format(max_rows, max_bytes)
+                        )
+
+                    # Coerce types
+                    for row in rows:
+                        for column in row:
+                            # Coerce decimal.Decimal objects to float objects
+                            # https://groups.google.com/d/msg/sqlalchemy/0qXMYJvq8SA/oqtvMD9Uw-kJ
+                            if isinstance(row[column], decimal.Decimal):
+                                row[column] = float(row[column])
+
+                            # Coerce memoryview objects (as from PostgreSQL's bytea columns) to bytes
+                            elif isinstance(row[column], memoryview):
+                                row[column] = bytes(row[column])
+
+                    # Rows to be returned, noting whether truncated if limited
+                    ret = rows
+                    if max_rows is not None or max_bytes is not None:
+                        ret = _Rows(rows)
+                        ret.truncated = truncated
+                    rowcount = len(rows)
+
+                # If INSERT, return primary key value for a newly inserted row (or None if none)
+                elif command == "INSERT":
+                    ret = _lastrowid(connection, result)
+
+                # If DELETE or UPDATE, return number of rows matched
+                elif command in ["DELETE", "UPDATE"]:
+                    ret = result.rowcount
+
+                # If CREATE VIEW, return True
+                elif command == "CREATE VIEW":
+                    ret = True
+
+            # If constraint violated
+            except sqlalchemy.exc.IntegrityError as e:
+                if self._autocommit:
+                    connection.execute(sqlalchemy.text("ROLLBACK"))
+                self._logger.error(termcolor.colored(_statement, "red"))
+                e = ValueError(e.orig)
+                e.__cause__ = None
+                raise e
+
+            # If user error
+            except (
+                sqlalchemy.exc.OperationalError,
+                sqlalchemy.exc.ProgrammingError,
+            ) as e:
+                if replica is None:  # Else just replica's connection, lest primary's transaction be rolled back
+                    self._disconnect()
+                self._logger.error(termcolor.colored(_statement, "red"))
+                if _is_locked(e):
+                    self._count("lock_failures")
+
+                # If interrupted, any transaction was rolled back
+                if _is_timeout(e):
+                    self._count("timeouts")
+                    if replica is None:
+                        self._autocommit = True
+                    e = StatementTimeout(e.orig)
+                else:
+                    e = RuntimeError(e.orig)
+                e.__cause__ = None
+                raise e
+
+            # Return value
+            else:
+                self._logger.info(termcolor.colored(_statement, "green"))
+                if self._autocommit:  # Don't stay connected unnecessarily
+                    self._disconnect()
+                return ret, rowcount
+
+            # Disconnect from replica, if any
+            finally:
+                if replica is not None:
+                    connection.close()
+                    self._release(replica)
+
+    @_enable_logging
+    def execute_script(self, sql):
+        """
+        Execute a script of SQL statements (or the script in a file, if sql is a path) in a single transaction.
+        Returns a list of dicts, one per statement, each with a statement and the seconds it took to execute.
+        """
+
+        # Lazily import
+        import os
+        import sqlalchemy
+        import sqlparse
+        import termcolor
+        import time
+        import warnings
+
+        # Temporary fix for missing sqlite3 module on the buildpack stack
+        try:
+            import sqlite3
+        except:
+            pass
+
+        # Read script from file
+        if os.path.isfile(sql):
+            with open(sql) as file:
+                sql = file.read()
+
+        # Split script into statements, respecting strings, comments, and triggers, and stripping comments
+        statements = []
+        for statement in sqlparse.split(sql):
+            statement = sqlparse.format(statement, strip_comments=True).strip()
+            if not statement:
+                continue
+
+            # If SQLite, ensure previous statement is complete per SQLite itself
+            # https://docs.python.org/3/library/sqlite3.html#sqlite3.complete_statement
+            if (
+                self._engine.url.get_backend_name() == "sqlite"
+                and statements
+                and not sqlite3.complete_statement(statements[-1])
+            ):
+                statements[-1] += "\n" + statement
+            else:
+                statements.append(statement)
+
+        # Reject writes early, if read-only
+        if self._readonly:
+            for statement in statements:
+                try:
+                    parsed = _parse(statement)
+                except RuntimeError:  # E.g., a trigger that SQLite deems one statement but sqlparse deems two
+                    raise RuntimeError("cannot write to read-only database: {}".format(statement))
+                self._check_writable(parsed)
+
+        # Catch SQLAlchemy warnings
+        with warnings.catch_warnings():
+            # Raise exceptions for warnings
+            warnings.simplefilter("error")
+
+            # Execute statements, via driver itself, timing each
+            timings = []
+            statement = "BEGIN"
+            self._schema.clear()
+            try:
+                with self._transaction() as connection:
+                    for statement in statements:
+                        with self._hooked(statement) as event:
+                            start = time.perf_counter()
+                            try:
+                                event["rowcount"] = connection.exec_driver_sql(statement).rowcount
+                            except (
+                                sqlalchemy.exc.IntegrityError,
+                                sqlalchemy.exc.OperationalError,
+                                sqlalchemy.exc.ProgrammingError,
+                            ) as e:  # As for execute, before hooks see exception
+                                self._logger.error(termcolor.colored(statement, "red"))
+                                raise _user_exception(e)
+                        timings.append(
+                            {"statement": statement, "seconds": time.perf_counter() - start}
+                        )
+                        self._logger.info(termcolor.colored(statement, "green"))
+
+            # If constraint violated
+            except sqlalchemy.exc.IntegrityError as e:
+                self._logger.error(termcolor.colored(statement, "red"))
+                e = ValueError(e.orig)
+                e.__cause__ = None
+                raise e
+
+            # If user error
+            except (
+                sqlalchemy.exc.OperationalError,
+                sqlalchemy.exc.ProgrammingError,
+            ) as e:
+                self._logger.error(termcolor.colored(statement, "red"))
+                e = RuntimeError(e.orig)
+                e.__cause__ = None
+                raise e
+
+            # Return timings
+            else:
+                return timings
+
+    def paginate(self, sql, *args, key="id", page_size=100, **kwargs):
+        """
+        Execute a SELECT, yielding its rows in pages (lists of dicts) of up to page_size rows each,
+        ordered by key, a column (or list of columns), each optionally followed by ASC or DESC. Rather
+        than skip rows with OFFSET, seeks to rows after the previous page's last key, which must not be
+        NULL.
+
+        https://use-the-index-luke.com/no-offset
+        """
+
+        # Lazily import
+        import re
+        import sqlparse
+
+        # Validate page size
+        if not isinstance(page_size, int) or page_size < 1:
+            raise RuntimeError("invalid page size: {}".format(page_size))
+
+        # Parse key into columns and whether each is descending
+        keys = []
+        for column in [key] if isinstance(key, str) else key:
+            matches = re.search(r"^\s*(\w+)(?:\s+(ASC|DESC))?\s*$", column, re.IGNORECASE)
+            if not matches:
+                raise RuntimeError("invalid key: {}".format(column))
+            keys.append(
+                (matches.group(1), (matches.group(2) or "").upper() == "DESC")
+            )
+        if not keys:
+            raise RuntimeError("missing key")
+
+        # Quote identifiers
+        quote = self._engine.dialect.identifier_preparer.quote
+        order = ", ".join(
+            "{} {}".format(quote(column), "DESC" if descending else "ASC")
+            for column, descending in keys
+        )
+
+        # Strip comments and trailing semicolon, so as to use as subquery
+        sql = sqlparse.format(sql, strip_comments=True).strip().rstrip(";")
+
+        last = None
+        while True:
+            # Seek to rows after last key, if any, a la (a > x) OR (a = x AND b > y)
+            where = ""
+            if last is not None:
+                where = " WHERE " + " OR ".join(
+                    "("
+                    + " AND ".join(
+                        "{} {} {}".format(
+                            quote(column),
+                            "=" if j < i else "<" if descending else ">",
+                            self._escape(last[j]),
+                        )
+                        for j, (column, descending) in enumerate(keys[: i + 1])
+                    )
+                    + ")"
+                    for i in range(len(keys))
+                )
+
+            # Execute
+            page = self.execute(
+                "SELECT * FROM ({}) AS _page{} ORDER BY {} LIMIT {:d}".format(
+                    sql, where, order, page_size
+                ),
+                *args,
+                **kwargs
+            )
+            if page:
+                yield page
+            if len(page) < page_size:
+                return
+
+            # Remember last key
+            try:
+                last = [page[-1][column] for column, _ in keys]
+            except KeyError as e:
+                raise RuntimeError("missing key in result: {}".format(e.args[0]))
+            if None in last:
+                raise RuntimeError("NULL key in result")
+
+    @_enable_logging
+    def upsert(self, table, rows, key=None, update=None, batch_size=500):
+        """
+        Insert rows (dicts with the same keys, column names) into table or, if a row with the same key, a column
+        (or list of columns) with a unique constraint, already exists, update its columns in update (by default, all
+        columns but key's; if none, such rows are skipped), in batches of up to batch_size rows each, in a single
+        transaction. Key defaults to table's primary key. Returns a dict with the number of rows inserted and updated.
+        """
+
+        # Lazily import
+        import re
+        import sqlalchemy
+        import termcolor
+        import warnings
+
+        # Validate batch size
+        if not isinstance(batch_size, int) or batch_size < 1:
+            raise RuntimeError("invalid batch size: {}".format(batch_size))
+
+        # Reject writes early, if read-only
+        if self._readonly:
+            raise RuntimeError("cannot write to read-only database: upsert into {}".format(table))
+
+        # Validate columns
+        rows = list(rows)
+        if not rows:
+            return {"inserted": 0, "updated": 0}
+        columns = list(rows[0])
+        if not columns:
+            raise RuntimeError("missing columns")
+        for row in rows:
+            if set(row) != set(columns):
+                raise RuntimeError("rows have different columns")
+        key = self.primary_key(table) if key is None else [key] if isinstance(key, str) else list(key)
+        if not key:
+            raise RuntimeError("missing key")
+        update = [column for column in columns if column not in key] if update is None else list(update)
+        for column in [table] + columns + key + update:
+            if not re.search(r"^\w+$", column):
+                raise RuntimeError("invalid identifier: {}".format(column))
+        for column in key + update:
+            if column not in columns:
+                raise RuntimeError("missing column in rows: {}".format(column))
+
+        # Quote identifiers
+        quote = self._engine.dialect.identifier_preparer.quote
+        backend = self._engine.url.get_backend_name()
+
+        # Update on conflict
+        # https://www.sqlite.org/lang_upsert.html
+        # https://www.postgresql.org/docs/current/sql-insert.html#SQL-ON-CONFLICT
+        # https://dev.mysql.com/doc/refman/8.0/en/insert-on-duplicate.html
+        if backend == "mysql":
+            conflict = "ON DUPLICATE KEY UPDATE " + ", ".join(
+                "{0} = VALUES({0})".format(quote(column)) for column in update or key[:1]
+            )
+        elif update:
+            conflict = "ON CONFLICT ({}) DO UPDATE SET {}".format(
+                ", ".join(quote(column) for column in key),
+                ", ".join("{0} = excluded.{0}".format(quote(column)) for column in update),
+            )
+        else:
+            conflict = "ON CONFLICT ({}) DO NOTHING".format(", ".join(quote(column) for column in key))
+
+        # Deduplicate rows by key, lest a batch update a row twice, the last such row winning
+        deduplicated = {}
+        for row in rows:
+            deduplicated[tuple(row[column] for column in key)] = row
+        rows = list(deduplicated.values())
+
+        # Catch SQLAlchemy warnings
+        with warnings.catch_warnings():
+            # Raise exceptions for warnings
+            warnings.simplefilter("error")
+
+            # Execute batches, via driver itself, counting rows that already exist
+            counts = {"inserted": 0, "updated": 0}
+            statement = "BEGIN"
+            try:
+                with self._transaction() as connection:
+                    for i in range(0, len(rows), batch_size):
+                        batch = rows[i : i + batch_size]
+                        literals = [
+                            {column: str(self._escape(row[column])) for column in columns} for row in batch
+                        ]
+
+                        # Count existing rows
+                        statement = "SELECT COUNT(*) FROM {} WHERE {}".format(
+                            quote(table),
+                            " OR ".join(
+                                "("
+                                + " AND ".join(
+                                    "{} = {}".format(quote(column), literal[column]) for column in key
+                                )
+                                + ")"
+                                for literal in literals
+                            ),
+                        )
+                        with self._hooked(statement) as event:
+                            try:
+                                existing = connection.exec_driver_sql(statement).scalar()
+                            except (
+                                sqlalchemy.exc.OperationalError,
+                                sqlalchemy.exc.ProgrammingError,
+                            ) as e:  # As for execute, before hooks see exception
+                                self._logger.error(termcolor.colored(statement, "red"))
+                                raise _user_exception(e)
+                            event["rowcount"] = 1
+                        self._logger.info(termcolor.colored(statement, "green"))
+
+                        # Insert or update rows
+                        statement = "INSERT INTO {} ({}) VALUES {} {}".format(
+                            quote(table),
+                            ", ".join(quote(column) for column in columns),
+                            ", ".join(
+                                "(" + ", ".join(literal[column] for column in columns) + ")"
+                                for literal in literals
+                            ),
+                            conflict,
+                        )
+                        with self._hooked(statement) as event:
+                            try:
+                                event["rowcount"] = connection.exec_driver_sql(statement).rowcount
+                            except (
+                                sqlalchemy.exc.IntegrityError,
+                                sqlalchemy.exc.OperationalError,
+                                sqlalchemy.exc.ProgrammingError,
+                            ) as e:  # As for execute, before hooks see exception
+                                self._logger.error(termcolor.colored(statement, "red"))
+                                raise _user_exception(e)
+                        self._logger.info(termcolor.colored(statement, "green"))
+                        counts["inserted"] += len(batch) - existing
+                        if update:
+                            counts["updated"] += existing
+
+            # If constraint violated
+            except sqlalchemy.exc.IntegrityError as e:
+                self._logger.error(termcolor.colored(statement, "red"))
+                e = ValueError(e.orig)
+                e.__cause__ = None
+                raise e
+
+            # If user error
+            except (
+                sqlalchemy.exc.OperationalError,
+                sqlalchemy.exc.ProgrammingError,
+            ) as e:
+                self._logger.error(termcolor.colored(statement, "red"))
+                e = RuntimeError(e.orig)
+                e.__cause__ = None
+                raise e
+
+            # Return counts
+            else:
+                return counts
+
+    def create_search_index(self, table, columns, tokenize=None, prefix=None):
+        """
+        Create a full-text index (a SQLite FTS5 virtual table, named table_search, whose content is table's) on
+        columns of table, kept in sync by triggers upon INSERTs, UPDATEs, and DELETEs, for search. Tokenize, if
+        not None, should be an FTS5 tokenizer (e.g., "porter unicode61"), and prefix, if not None, a list of
+        lengths of prefixes to index too (e.g., [2, 3]), so that prefix queries needn't scan the index.
+
+        https://www.sqlite.org/fts5.html#external_content_tables
+        """
+
+        # Lazily import
+        import re
+
+        # Validate arguments
+        if self._engine.url.get_backend_name() != "sqlite":
+            raise RuntimeError("search indexes require SQLite")
+        columns = [columns] if isinstance(columns, str) else list(columns)
+        if not columns:
+            raise RuntimeError("missing columns")
+        for identifier in [table] + columns:
+            if not re.search(r"^\w+$", identifier):
+                raise RuntimeError("invalid identifier: {}".format(identifier))
+        existing = [column["name"] for column in self.columns(table)]
+        for column in columns:
+            if column not in existing:
+                raise RuntimeError("no such column: {}".format(column))
+        if tokenize is not None and not re.search(r"^\w+(?: \w+)*$", tokenize):
+            raise RuntimeError("invalid tokenize: {}".format(tokenize))
+        if prefix is not None and not all(isinstance(n, int) and 0 < n < 1000 for n in prefix):
+            raise RuntimeError("invalid prefix: {}".format(prefix))
+
+        # Options
+        quote = self._engine.dialect.identifier_preparer.quote
+        index = quote(table + "_search")
+        options = [quote(column) for column in columns]
+        options.append("content={}".format(self._escape(table)))
+        if tokenize is not None:
+            options.append("tokenize={}".format(self._escape(tokenize)))
+        if prefix is not None:
+            options.append("prefix={}".format(self._escape(" ".join(str(n) for n in prefix))))
+
+        # Create index and triggers, then index existing rows, in one transaction
+        names = {
+            "columns": ", ".join(options[: len(columns)]),
+            "index": index,
+            "new": ", ".join("new." + quote(column) for column in columns),
+            "old": ", ".join("old." + quote(column) for column in columns),
+            "table": quote(table),
+        }
+        insert = "INSERT INTO {index}(rowid, {columns}) VALUES(new.rowid, {new});"
+        delete = "INSERT INTO {index}({index}, rowid, {columns}) VALUES('delete', old.rowid, {old});"
+        self._search_index(table, [
+            "CREATE VIRTUAL TABLE {} USING fts5({})".format(index, ", ".join(options)),
+            "CREATE TRIGGER {} AFTER INSERT ON {} BEGIN {} END".format(
+                quote(table + "_search_insert"), names["table"], insert.format(**names)
+            ),
+            "CREATE TRIGGER {} AFTER DELETE ON {} BEGIN {} END".format(
+                quote(table + "_search_delete"), names["table"], delete.format(**names)
+            ),
+            "CREATE TRIGGER {} AFTER UPDATE ON {} BEGIN {} {} END".format(
+                quote(table + "_search_update"), names["table"], delete.format(**names), insert.format(**names)
+            ),
+            "INSERT INTO {0}({0}) VALUES('rebuild')".format(index),
+        ])
+
+    def drop_search_index(self, table):
+        """Drop table's full-text index, per create_search_index, and its triggers."""
+        quote = self._engine.dialect.identifier_preparer.quote
+        self._search_index(table, [
+            "DROP TRIGGER IF EXISTS {}".format(quote(table + "_search_" + trigger))
+            for trigger in ["delete", "insert", "update"]
+        ] + ["DROP TABLE {}".format(quote(table + "_search"))])
+
+    def optimize_search_index(self, table):
+        """Merge table's full-text index's b-trees into one, for faster searches (e.g., after many writes)."""
+        index = self._engine.dialect.identifier_preparer.quote(table + "_search")
+        self._search_index(table, ["INSERT INTO {0}({0}) VALUES('optimize')".format(index)])
+
+    def rebuild_search_index(self, table):
+        """Rebuild table's full-text index from table (e.g., if table was changed while triggers were dropped)."""
+        index = self._engine.dialect.identifier_preparer.quote(table + "_search")
+        self._search_index(table, ["INSERT INTO {0}({0}) VALUES('rebuild')".format(index)])
+
+    def _search_index(self, table, statements):
+        """Execute statements, which create, drop, or maintain table's full-text index, in one transaction."""
+
+        # Lazily import
+        import re
+        import sqlalchemy
+        import termcolor
+
+        if self._engine.url.get_backend_name() != "sqlite":
+            raise RuntimeError("search indexes require SQLite")
+        if self._readonly:
+            raise RuntimeError("cannot write to read-only database")
+        if not re.search(r"^\w+$", table):
+            raise RuntimeError("invalid identifier: {}".format(table))
+
+        statement = None
+        try:
+            with self._transaction() as connection:
+                for statement in statements:
+                    connection.exec_driver_sql(statement)
+        except (sqlalchemy.exc.OperationalError, sqlalchemy.exc.ProgrammingError) as e:
+            self._logger.error(termcolor.colored(statement, "red"))
+            e = RuntimeError(e.orig)
+            e.__cause__ = None
+            raise e
+        for statement in statements:
+            self._logger.info(termcolor.colored(statement, "green"))
+        self._schema.clear()
+
+    def search(self, table, query, limit=10, snippet=True, raw=False):
+        """
+        Search table's full-text index, per create_search_index, returning up to limit of table's rows (as dicts)
+        that match query, best first, each with a score (per bm25, lower being better) and, if snippet, a snippet
+        of text around the matches therein, each marked with <mark> and </mark> (but otherwise not escaped). Unless
+        raw, whereby query uses FTS5's own syntax, query's words are matched as is, the last as a prefix too.
+
+        https://www.sqlite.org/fts5.html#full_text_query_syntax
+        """
+
+        # Lazily import
+        import re
+
+        if self._engine.url.get_backend_name() != "sqlite":
+            raise RuntimeError("search indexes require SQLite")
+        if not re.search(r"^\w+$", table):
+            raise RuntimeError("invalid identifier: {}".format(table))
+        if not isinstance(limit, int) or limit < 1:
+            raise RuntimeError("invalid limit: {}".format(limit))
+
+        # Quote words, lest they be mistaken for operators
+        if not raw:
+            words = ['"{}"'.format(word.replace('"', '""')) for word in query.split()]
+            if not words:
+                return []
+            words[-1] += "*"
+            query = " ".join(words)
+
+        # Order by rank (i.e., bm25), which FTS5 sorts by more efficiently than by bm25() itself
+        # https://www.sqlite.org/fts5.html#sorting_by_auxiliary_function_results
+        quote = self._engine.dialect.identifier_preparer.quote
+        return self.execute(
+            "SELECT {table}.*, {index}.rank AS score{snippet} FROM {index} JOIN {table} ON {table}.rowid = {index}.rowid "
+            "WHERE {index} MATCH ? ORDER BY {index}.rank LIMIT ?".format(
+                index=quote(table + "_search"),
+                snippet=", snippet({}, -1, '<mark>', '</mark>', '…', 16) AS snippet".format(
+                    quote(table + "_search")
+                ) if snippet else "",
+                table=quote(table),
+            ),
+            query,
+            limit,
+        )
+
+    def open_blob(self, table, column, rowid, mode="r"):
+        """
+        Open the BLOB in column of table's row whose rowid (or, other than for SQLite, primary key) is rowid,
+        returning a file-like object whereby to read it (and, if mode is "w", overwrite it, in place, without
+        changing its size) incrementally, rather than all at once. With SQLite, uses sqlite3.Connection.blobopen,
+        if available, else SUBSTR and UPDATE, a chunk at a time.
+        """
+
+        # Lazily import
+        import re
+        import sqlalchemy
+
+        # Validate arguments
+        if mode not in ["r", "w"]:
+            raise RuntimeError("invalid mode: {}".format(mode))
+        if mode == "w" and self._readonly:
+            raise RuntimeError("cannot write to read-only database")
+        for identifier in [table, column]:
+            if not re.search(r"^\w+$", identifier):
+                raise RuntimeError("invalid identifier: {}".format(identifier))
+
+        # Infer key
+        sqlite = self._engine.url.get_backend_name() == "sqlite"
+        key = "rowid" if sqlite else None
+        if not sqlite:
+            key = self.primary_key(table)
+            if len(key) != 1:
+                raise RuntimeError("table must have a primary key of one column: {}".format(table))
+            key = key[0]
+
+        # Use this thread's connection if within a transaction, else a connection just for this BLOB
+        self._checked()
+        close = self._autocommit
+        connection = self._engine.connect() if close else self._connect()
+        try:
+            dbapi_connection = connection.connection.dbapi_connection
+            if sqlite and hasattr(dbapi_connection, "blobopen"):
+                blob = dbapi_connection.blobopen(table, column, rowid, readonly=mode == "r")
+                return _SQLiteBlob(connection, close, blob, mode == "w")
+            return _ChunkedBlob(connection, close, table, column, key, rowid, mode == "w")
+        except (sqlalchemy.exc.DBAPIError, connection.dialect.dbapi.Error) as e:
+            if close:
+                connection.close()
+            e = RuntimeError(e)
+            e.__cause__ = None
+            raise e
+        except:
+            if close:
+                connection.close()
+            raise
+
+    def load_from(self, path):
+        """Replace this SQLite database's contents with those of the SQLite database at path."""
+
+        # Lazily import
+        import os
+        import sqlite3
+
+        if not os.path.isfile(path):
+            raise RuntimeError("does not exist: {}".format(path))
+        source = sqlite3.connect(path)
+        try:
+            self._backup(source, None)
+        finally:
+            source.close()
+
+        # Clear cached schema, since (possibly) changed
+        self._schema.clear()
+
+    def save_to(self, path):
+        """Save a snapshot of this SQLite database to a (new or existing) SQLite database at path."""
+
+        # Lazily import
+        import sqlite3
+
+        target = sqlite3.connect(path)
+        try:
+            self._backup(None, target)
+        finally:
+            target.close()
+
+    def _backup(self, source, target):
+        """
+        Copy the SQLite database source to this database (if target is None) or this database to the SQLite
+        database target (if source is None), via SQLite's backup API.
+
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection.backup
+        """
+
+        # Lazily import
+        import sqlite3
+
+        if self._engine.url.get_backend_name() != "sqlite":
+            raise RuntimeError("can only load or save SQLite databases")
+        if not self._autocommit:
+            raise RuntimeError("cannot load or save within a transaction")
+
+        try:
+            connection = self._connect().connection.dbapi_connection
+            (source or connection).backup(target or connection)
+        except sqlite3.Error as e:
+            e = RuntimeError(e)
+            e.__cause__ = None
+            raise e
+        finally:
+            self._disconnect()
+
+    def tables(self):
+        """Returns list of names of tables in database."""
+        return self._introspect("tables", None)
+
+    def columns(self, table):
+        """Returns list of dicts, one per column in table, each with name, type, nullable, and default."""
+        return self._introspect("columns", table)
+
+    def primary_key(self, table):
+        """Returns list of names of columns in table's primary key."""
+        return self._introspect("primary_key", table)
+
+    def indexes(self, table):
+        """Returns list of dicts, one per index on table, each with name, columns, and unique."""
+        return self._introspect("indexes", table)
+
+    def _introspect(self, kind, table):
+        """
+        Returns copy of cached schema of kind for table, introspecting database if not yet cached.
+
+        https://docs.sqlalchemy.org/en/latest/core/reflection.html#fine-grained-reflection-with-inspector
+        """
+
+        # Lazily import
+        import copy
+        import sqlalchemy
+
+        # If not yet cached
+        if (kind, table) not in self._schema:
+            try:
+                inspector = sqlalchemy.inspect(self._connect())
+                if kind == "tables":
+                    value = inspector.get_table_names()
+                elif kind == "columns":
+                    value = [
+                        {
+                            "name": column["name"],
+                            "type": str(column["type"]),
+                            "nullable": column["nullable"],
+                            "default": column["default"],
+                        }
+                        for column in inspector.get_columns(table)
+                    ]
+                elif kind == "primary_key":
+                    value = inspector.get_pk_constraint(table)["constrained_columns"]
+                elif kind == "indexes":
+                    value = [
+                        {
+                            "name": index["name"],
+                            "columns": index["column_names"],
+                            "unique": index["unique"],
+                        }
+                        for index in inspector.get_indexes(table)
+                    ]
+            except sqlalchemy.exc.NoSuchTableError:
+                raise RuntimeError("no such table: {}".format(table))
+            finally:
+                if self._autocommit:  # Don't stay connected unnecessarily
+                    self._disconnect()
+            self._schema[(kind, table)] = value
+
+        # Return copy, lest caller modify cache
+        return copy.deepcopy(self._schema[(kind, table)])
+
+    def statistics(self):
+        """
+        Returns dict of statistics: lock_failures (statements that failed because the database was
+        locked), retries, retry_seconds (spent backing off before retries), timeouts, connections (open
+        to primary, as gauge), connections_per_thread (dict mapping names of threads to their numbers of
+        open connections), and, if grouping commits, group_commits (transactions committed by writer
+        thread) and grouped (statements therein).
+        """
+        with self._lock:
+            statistics = dict(self._statistics)
+        statistics["connections_per_thread"] = self._connections.per_thread()
+        statistics["connections"] = sum(statistics["connections_per_thread"].values())
+        if self._group is not None:
+            statistics.update(self._group.statistics())
+        return statistics
+
+    def _backoff_for(self, attempt):
+        """
+        Sleeps before retry number attempt, for a random duration up to backoff * 2 ** attempt
+        seconds (but no more than one second).
+
+        https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+        """
+
+        # Lazily import
+        import random
+        import time
+
+        seconds = random.uniform(0, min(1, self._backoff * 2**attempt))
+        time.sleep(seconds)
+        self._count("retries")
+        self._count("retry_seconds", seconds)
+
+    def _count(self, statistic, n=1):
+        """Adds n to statistic."""
+        with self._lock:
+            self._statistics[statistic] += n
+
+    def _route(self, command, route):
+        """
+        Returns index of replica to which to route command, or None if primary. Routes SELECTs outside of
+        transactions to replicas unless route is "primary"; route may be "replica" to read from one even
+        within a transaction.
+        """
+
+        # Validate route
+        if route not in [None, "primary", "replica"]:
+            raise RuntimeError("invalid route: {}".format(route))
+        if route == "replica" and command != "SELECT":
+            raise RuntimeError("cannot route {} to replica".format(command))
+
+        # Use primary if no replicas, writes, or within a transaction
+        if not self._replicas or route == "primary":
+            return None
+        if route is None and (command != "SELECT" or not self._autocommit):
+            return None
+
+        # Choose replica
+        with self._lock:
+            if self._balance == "least_busy":
+                indices = range(self._turn, self._turn + len(self._replicas))
+                replica = min(indices, key=lambda i: self._busy[i % len(self._replicas)]) % len(self._replicas)
+            else:
+                replica = self._turn % len(self._replicas)
+            self._turn = (self._turn + 1) % len(self._replicas)
+            self._busy[replica] += 1
+        return replica
+
+    def _release(self, replica):
+        """Marks replica as no longer busy with a statement."""
+        with self._lock:
+            self._busy[replica] -= 1
+
+    def _escape(self, value):
+        """
+        Escapes value using engine's conversion function.
+
+        https://docs.sqlalchemy.org/en/latest/core/type_api.html#sqlalchemy.types.TypeEngine.literal_processor
+        """
+
+        # Lazily import
+        import sqlparse
+
+        def __escape(value):
+            # Lazily import
+            import datetime
+            import sqlalchemy
+
+            # bool
+            if isinstance(value, bool):
+                return sqlparse.sql.Token(
+                    sqlparse.tokens.Number,
+                    sqlalchemy.types.Boolean().literal_processor(self._engine.dialect)(
+                        value
+                    ),
+                )
+
+            # bytes
+            elif isinstance(value, bytes):
+                if self._engine.url.get_backend_name() in ["mysql", "sqlite"]:
+                    return sqlparse.sql.Token(
+                        sqlparse.tokens.Other, f"x'{value.hex()}'"
+                    )  # https://dev.mysql.com/doc/refman/8.0/en/hexadecimal-literals.html
+                elif self._engine.url.get_backend_name() == "postgresql":
+                    return sqlparse.sql.Token(
+                        sqlparse.tokens.Other, f"'\\x{value.hex()}'"
+                    )  # https://dba.stackexchange.com/a/203359
+                else:
+                    raise RuntimeError("unsupported value: {}".format(value))
+
+            # datetime.datetime
+            elif isinstance(value, datetime.datetime):
+                return sqlparse.sql.Token(
+                    sqlparse.tokens.String,
+                    sqlalchemy.types.String().literal_processor(self._engine.dialect)(
+                        value.strftime("%Y-%m-%d %H:%M:%S")
+                    ),
+                )
+
+            # datetime.date
+            elif isinstance(value, datetime.date):
+                return sqlparse.sql.Token(
+                    sqlparse.tokens.String,
+                    sqlalchemy.types.String().literal_processor(self._engine.dialect)(
+                        value.strftime("%Y-%m-%d")
+                    ),
+                )
+
+            # datetime.time
+            elif isinstance(value, datetime.time):
+                return sqlparse.sql.Token(
+                    sqlparse.tokens.String,
+                    sqlalchemy.types.String().literal_processor(self._engine.dialect)(
+                        value.strftime("%H:%M:%S")
+                    ),
+                )
+
+            # float
+            elif isinstance(value, float):
+                return sqlparse.sql.Token(
+                    sqlparse.tokens.Number,
+                    sqlalchemy.types.Float().literal_processor(self._engine.dialect)(
+                        value
+                    ),
+                )
+
+            # int
+            elif isinstance(value, int):
+                return sqlparse.sql.Token(
+                    sqlparse.tokens.Number,
+                    sqlalchemy.types.Integer().literal_processor(self._engine.dialect)(
+                        value
+                    ),
+                )
+
+            # str
+            elif isinstance(value, str):
+                return sqlparse.sql.Token(
+                    sqlparse.tokens.String,
+                    sqlalchemy.types.String().literal_processor(self._engine.dialect)(
+                        value
+                    ),
+                )
+
+            # None
+            elif value is None:
+                return sqlparse.sql.Token(sqlparse.tokens.Keyword, sqlalchemy.null())
+
+            # Unsupported value
+            else:
+                raise RuntimeError("unsupported value: {}".format(value))
+
+        # Escape value(s), separating with commas as needed
+        if isinstance(value, (list, tuple)):
+            return sqlparse.sql.TokenList(
+                sqlparse.parse(", ".join([str(__escape(v)) for v in value]))
+            )
+        else:
+            return __escape(value)
+
+
+class _PreparedStatement(object):
+    """A statement prepared by SQL.prepare, to be called with values for its placeholders."""
+
+    def __init__(self, db, statement):
+        self._db = db
+        self._statement = statement
+
+    def __call__(self, *args, **kwargs):
+        """Execute statement with values for its placeholders."""
+        return self._db._execute(self._statement, args, kwargs, prepared=True)
+
+    def __repr__(self):
+        return "<prepared statement {!r}>".format(self._statement.sql)
+
+
+class _Loader(object):
+    """A loader of rows by key, per SQL.loader."""
+
+    def __init__(self, db, table, key, batch_size):
+        quote = db._engine.dialect.identifier_preparer.quote
+        self._batch_size = batch_size
+        self._db = db
+        self._key = key
+        self._local = threading.local()
+        self._sql = "SELECT * FROM {} WHERE {} IN (?)".format(quote(table), quote(key))
+
+    def load(self, value):
+        """Returns (lazy) row whose key is value."""
+        batch = self._batch()
+        if value not in batch.rows:
+            batch.pending[value] = None
+        return _LazyRow(batch, value)
+
+    def load_many(self, values):
+        """Returns list of (lazy) rows whose keys are values."""
+        return [self.load(value) for value in values]
+
+    def clear(self):
+        """Forget rows cached for this thread (or, with Flask, request)."""
+        batch = self._batch()
+        batch.rows.clear()
+
+    def _batch(self):
+        """
+        Returns this request's batch, if within a Flask request (whose rows are cached until it ends), else
+        this thread's (whose rows are forgotten once it's resolved).
+        """
+
+        # If within a Flask request
+        try:
+            import flask
+
+            if flask.has_request_context():
+                batches = flask.g.setdefault("_cs50_loaders", {})
+                if id(self) not in batches:
+                    batches[id(self)] = _Batch(self, cached=True)
+                return batches[id(self)]
+        except ModuleNotFoundError:
+            pass
+
+        # Else this thread's
+        batch = getattr(self._local, "batch", None)
+        if batch is None:
+            batch = self._local.batch = _Batch(self, cached=False)
+        return batch
+
+    def _select(self, values):
+        """Returns dict mapping values to rows whose keys they are, selecting batch_size values at a time."""
+        rows = {}
+        for i in range(0, len(values), self._batch_size):
+            for row in self._db.execute(self._sql, values[i : i + self._batch_size]):
+                rows.setdefault(row[self._key], row)
+        return rows
+
+
+class _Batch(object):
+    """A loader's values pending selection, and rows already selected, for a thread or Flask request."""
+
+    def __init__(self, loader, cached):
+        self.cached = cached
+        self.loader = loader
+        self.pending = {}  # Ordered set of values
+        self.rows = {}
+
+    def row(self, value):
+        """Returns row whose key is value (or None if none), selecting it and all pending rows if not yet."""
+        if value not in self.rows:
+            self.pending[value] = None
+            values, self.pending = list(self.pending), {}
+            rows = self.loader._select(values)
+            for v in values:
+                self.rows[v] = rows.get(v)
+
+            # If not caching, start a new batch for subsequent loads
+            if not self.cached and getattr(self.loader._local, "batch", None) is self:
+                del self.loader._local.batch
+        return self.rows[value]
+
+
+class _LazyRow(collections.abc.Mapping):
+    """A row, per _Loader.load, selected upon first access."""
+
+    def __init__(self, batch, value):
+        self._batch = batch
+        self._row = None
+        self._value = value
+
+    def _resolve(self):
+        if self._row is None:
+            self._row = self._batch.row(self._value) or {}
+            self._batch = None
+        return self._row
+
+    def __getitem__(self, column):
+        return self._resolve()[column]
+
+    def __iter__(self):
+        return iter(self._resolve())
+
+    def __len__(self):
+        return len(self._resolve())
+
+    def __repr__(self):
+        return repr(self._resolve())
+
+
+class _Connections(object):
+    """
+    A registry of an instance's connections, at most one per thread, each closed when its thread exits (or
+    when the registry itself is garbage-collected), since each thread's key is then garbage-collected too.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._open = {}  # Maps ids of threads' keys to threads' names and connections
+
+    def close(self):
+        """Close every thread's connection."""
+        with self._lock:
+            entries, self._open = list(self._open.values()), {}
+        for _, connection in entries:
+            _close(connection)
+
+    def get(self):
+        """Returns this thread's connection, if any, else None."""
+        key = getattr(self._local, "key", None)
+        entry = self._open.get(id(key)) if key is not None else None
+        return entry[1] if entry is not None else None
+
+    def per_thread(self):
+        """Returns dict mapping names of threads to their numbers of connections."""
+        counts = {}
+        with self._lock:
+            for name, _ in self._open.values():
+                counts[name] = counts.get(name, 0) + 1
+        return counts
+
+    def pop(self):
+        """Forget and return this thread's connection, if any, else None."""
+        key = getattr(self._local, "key", None)
+        if key is None:
+            return None
+        del self._local.key
+        with self._lock:
+            entry = self._open.pop(id(key), None)
+        return entry[1] if entry is not None else None
+
+    def set(self, connection):
+        """Remember and return connection as this thread's, closing it when this thread exits."""
+        key = self._local.key = _Key()
+        with self._lock:
+            self._open[id(key)] = (threading.current_thread().name, connection)
+        weakref.finalize(key, self._discard, id(key)).atexit = False
+        return connection
+
+    def _discard(self, key):
+        """Close connection for key, if still open, as when its thread has exited."""
+        with self._lock:
+            entry = self._open.pop(key, None)
+        if entry is not None:
+            _close(entry[1])
+
+
+class _Key(object):
+    """A thread's key in a registry of connections, garbage-collected when the thread exits."""
+
+
+class _GroupCommit(object):
+    """
+    A writer thread, per SQL's group_commit, that executes writes submitted by other threads in shared
+    transactions.
+    """
+
+    def __init__(self, engine, window):
+        # Lazily import
+        import queue
+
+        self._engine = engine
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._statistics = {"group_commits": 0, "grouped": 0}
+        self._thread = None
+        self._window = window
+
+    def statistics(self):
+        """Returns dict of statistics: group_commits and grouped."""
+        with self._lock:
+            return dict(self._statistics)
+
+    def stop(self):
+        """
+        Stop writer thread, if started, once it's executed writes already submitted (and closed its connection),
+        waiting for it unless called by it. Another is started upon next submit.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                self._queue.put(None)
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def submit(self, parsed, statement, parameters):
+        """
+        Have writer thread execute a parsed, bound SQL statement (or, if parameters is not None, its driver_sql
+        with parameters), returning its return value and its number of rows once committed (else raising).
+        """
+
+        # Lazily import
+        import concurrent.futures
+
+        # Start writer thread, if not yet started
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._write, daemon=True, name="cs50-group-commit")
+                self._thread.start()
+
+        future = concurrent.futures.Future()
+        self._queue.put((parsed, statement, parameters, future))
+        return future.result()
+
+    def _write(self):
+        """Execute writes, as submitted, in batches of however many are submitted within window of first."""
+
+        # Lazily import
+        import queue
+        import time
+
+        connection = None
+        stopping = False
+        while not stopping:
+            # Wait for first write, then for others within window
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self._window
+            while batch[-1] is not None:
+                try:
+                    batch.append(self._queue.get(timeout=max(0, deadline - time.perf_counter())))
+                except queue.Empty:
+                    break
+            if batch[-1] is None:
+                stopping = True
+                batch.pop()
+            if not batch:
+                continue
+
+            # Execute writes within one transaction, optimistically without savepoints, else (if any write fails)
+            # again with a savepoint per write, rolling back each write that fails to its savepoint
+            try:
+                if connection is None:
+                    connection = self._engine.connect()
+                outcomes = self._execute(connection, batch, savepoints=False)
+                if outcomes is None:
+                    outcomes = self._execute(connection, batch, savepoints=True)
+
+            # If transaction itself failed (or anything else did), fail all writes therein, lest callers wait forever
+            except Exception as e:
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+                    connection = None
+                for _, _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(RuntimeError(getattr(e, "orig", e)))
+                continue
+
+            # Return or raise for each write, now that committed
+            with self._lock:
+                self._statistics["group_commits"] += 1
+                self._statistics["grouped"] += len(batch)
+            for future, value, exception in outcomes:
+                if future.done():
+                    continue
+                if exception is not None:
+                    future.set_exception(exception)
+                else:
+                    future.set_result(value)
+
+        # Disconnect
+        if connection is not None:
+            connection.close()
+
+    def _execute(self, connection, batch, savepoints):
+        """
+        Execute batch of writes within one transaction on connection, each within a savepoint, if savepoints,
+        returning a list of each write's future, return value and number of rows, and exception. If not
+        savepoints, rolls back transaction and returns None upon any write's failure.
+        """
+
+        # Lazily import
+        import sqlalchemy
+
+        outcomes = []
+        connection.exec_driver_sql("BEGIN")
+        for parsed, statement, parameters, future in batch:
+            if savepoints:
+                connection.exec_driver_sql("SAVEPOINT cs50")
+            try:
+                if parameters is None:
+                    result = connection.execute(sqlalchemy.text(statement))
+                else:
+                    result = connection.exec_driver_sql(parsed.driver_sql, parameters)
+                if parsed.command == "INSERT":
+                    ret = _lastrowid(connection, result)
+                else:
+                    ret = result.rowcount
+                if savepoints:
+                    connection.exec_driver_sql("RELEASE SAVEPOINT cs50")
+                outcomes.append((future, (ret, result.rowcount), None))
+            except sqlalchemy.exc.DBAPIError as e:
+                if not savepoints or _is_locked(e):  # Then transaction can't continue
+                    connection.exec_driver_sql("ROLLBACK")
+                    if savepoints:
+                        raise
+                    return None
+                connection.exec_driver_sql("ROLLBACK TO SAVEPOINT cs50")
+                connection.exec_driver_sql("RELEASE SAVEPOINT cs50")
+                if isinstance(e, sqlalchemy.exc.IntegrityError):
+                    outcomes.append((future, None, ValueError(e.orig)))
+                else:
+                    outcomes.append((future, None, RuntimeError(e.orig)))
+        connection.exec_driver_sql("COMMIT")
+        return outcomes
+
+
+class _SQLiteBlob(io.RawIOBase):
+    """A file-like SQLite BLOB, per SQL.open_blob, read and written incrementally via sqlite3.Blob."""
+
+    def __init__(self, connection, close, blob, writable):
+        self._blob = blob
+        self._close = close
+        self._connection = connection
+        self._writable = writable
+
+    def close(self):
+        """Close BLOB (and its connection, unless this thread's)."""
+        if not self.closed:
+            try:
+                self._blob.close()
+                if self._close:
+                    self._connection.close()
+            finally:
+                super().close()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        """Read up to len(buffer) bytes into buffer, returning how many were read."""
+        data = self._blob.read(len(buffer))
+        memoryview(buffer).cast("B")[: len(data)] = data
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._blob.seek(offset, whence)
+        return self._blob.tell()
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._blob.tell()
+
+    def writable(self):
+        return self._writable
+
+    def write(self, b):
+        """Overwrite len(b) bytes with b, which must not extend beyond BLOB's end."""
+        if not self._writable:
+            raise io.UnsupportedOperation("not writable")
+        try:
+            self._blob.write(b)
+        except ValueError:
+            e = RuntimeError("cannot write beyond end of BLOB")
+            e.__cause__ = None
+            raise e
+        return len(b)
+
+
+class _ChunkedBlob(io.RawIOBase):
+    """
+    A file-like BLOB, per SQL.open_blob, read and written a chunk at a time via SUBSTR and UPDATE of the row whose
+    key is rowid, with values bound by the driver, rather than escaped.
+    """
+
+    def __init__(self, connection, close, table, column, key, rowid, writable):
+        self._close = close
+        self._connection = connection
+        self._position = 0
+        self._rowid = rowid
+        self._writable = writable
+
+        # Statements, with driver's placeholders
+        quote = connection.dialect.identifier_preparer.quote
+        table, column, key = quote(table), quote(column), quote(key)
+        placeholder = "?" if connection.dialect.paramstyle == "qmark" else "%s"
+        where = " FROM {} WHERE {} = {}".format(table, key, placeholder)
+        self._length = "SELECT LENGTH({})".format(column) + where
+        self._read = "SELECT SUBSTR({0}, {1}, {1})".format(column, placeholder) + where
+        concatenation = {
+            "mysql": "CONCAT({}, {}, {})",
+            "sqlite": "CAST({} || {} || {} AS BLOB)",  # Else TEXT
+        }.get(connection.dialect.name, "{} || {} || {}")
+        self._write = "UPDATE {} SET {} = {} WHERE {} = {}".format(
+            table,
+            column,
+            concatenation.format(
+                "SUBSTR({}, 1, {})".format(column, placeholder),
+                placeholder,
+                "SUBSTR({}, {})".format(column, placeholder),
+            ),
+            key,
+            placeholder,
+        )
+
+        # Remember length
+        self._size = self._execute(self._length, (rowid,))
+        if self._size is None:
+            raise RuntimeError("no such BLOB: {}".format(rowid))
+
+    def close(self):
+        """Close BLOB (and its connection, unless this thread's)."""
+        if not self.closed:
+            try:
+                if self._close:
+                    self._connection.close()
+            finally:
+                super().close()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        """Read up to len(buffer) bytes into buffer, returning how many were read."""
+        n = min(len(buffer), self._size - self._position)
+        if n <= 0:
+            return 0
+        data = self._execute(self._read, (self._position + 1, n, self._rowid))
+        memoryview(buffer).cast("B")[: len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size
+        if not 0 <= offset <= self._size:
+            raise ValueError("offset out of bounds")
+        self._position = offset
+        return self._position
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def writable(self):
+        return self._writable
+
+    def write(self, b):
+        """Overwrite len(b) bytes with b, which must not extend beyond BLOB's end."""
+        if not self._writable:
+            raise io.UnsupportedOperation("not writable")
+        if self._position + len(b) > self._size:
+            raise RuntimeError("cannot write beyond end of BLOB")
+        self._execute(self._write, (self._position, bytes(b), self._position + len(b) + 1, self._rowid))
+        self._position += len(b)
+        return len(b)
+
+    def _execute(self, statement, parameters):
+        """Execute statement with parameters via driver, returning first column of first row, if any."""
+
+        # Lazily import
+        import sqlalchemy
+
+        try:
+            result = self._connection.exec_driver_sql(statement, parameters)
+            return result.scalar() if result.returns_rows else None
+        except sqlalchemy.exc.DBAPIError as e:
+            e = RuntimeError(e.orig)
+            e.__cause__ = None
+            raise e
+
 
-    def _name(self):
-        """Return object's hash as a str."""
-        return str(hash(self))
+class _Statement(object):
+    """A SQL statement, parsed, with its command and placeholders inferred."""
 
-    @_enable_logging
-    def execute(self, sql, *args, **kwargs):
-        """Execute a SQL statement."""
+    def __init__(self, sql):
+        """Parse a SQL statement."""
 
         # Lazily import
-        import decimal
-        import re
-        import sqlalchemy
         import sqlparse
-        import termcolor
-        import warnings
+
+        # Remember statement
+        self.sql = sql
 
         # Parse statement, stripping comments and then leading/trailing whitespace
         statements = sqlparse.parse(sqlparse.format(sql, strip_comments=True).strip())
@@ -151,10 +2358,6 @@ class SQL(object):
         elif len(statements) == 0:
             raise RuntimeError("missing statement")
 
-        # Ensure named and positional parameters are mutually exclusive
-        if len(args) > 0 and len(kwargs) > 0:
-            raise RuntimeError("cannot pass both positional and named parameters")
-
         # Infer command from flattened statement to a single string separated by spaces
         full_statement = " ".join(
             str(token)
@@ -166,14 +2369,16 @@ class SQL(object):
                 sqlparse.tokens.Keyword.DML,
             ]
         )
-        full_statement = full_statement.upper()
+        self.full_statement = full_statement.upper()
 
         # Set of possible commands
         commands = {
             "BEGIN",
+            "COMMIT",
             "CREATE VIEW",
             "DELETE",
             "INSERT",
+            "ROLLBACK",
             "SELECT",
             "START",
             "UPDATE",
@@ -181,32 +2386,76 @@ class SQL(object):
         }
 
         # Check if the full_statement starts with any command
-        command = next(
-            (cmd for cmd in commands if full_statement.startswith(cmd)), None
+        self.command = next(
+            (cmd for cmd in commands if self.full_statement.startswith(cmd)), None
         )
 
         # Flatten statement
-        tokens = list(statements[0].flatten())
+        self.tokens = list(statements[0].flatten())
 
         # Validate paramstyle
-        placeholders = {}
-        paramstyle = None
-        for index, token in enumerate(tokens):
+        self.placeholders = {}
+        self.paramstyle = None
+        for index, token in enumerate(self.tokens):
             # If token is a placeholder
             if token.ttype == sqlparse.tokens.Name.Placeholder:
                 # Determine paramstyle, name
                 _paramstyle, name = _parse_placeholder(token)
 
                 # Remember paramstyle
-                if not paramstyle:
-                    paramstyle = _paramstyle
+                if not self.paramstyle:
+                    self.paramstyle = _paramstyle
 
                 # Ensure paramstyle is consistent
-                elif _paramstyle != paramstyle:
+                elif _paramstyle != self.paramstyle:
                     raise RuntimeError("inconsistent paramstyle")
 
                 # Remember placeholder's index, name
-                placeholders[index] = name
+                self.placeholders[index] = name
+
+        # Statement for driver's own qmark paramstyle, for SQLite
+        self.driver_sql = "".join(
+            "?" if index in self.placeholders else str(token)
+            for index, token in enumerate(self.tokens)
+        )
+
+        # For SQL statements where a colon is required verbatim, as within an inline string, use a backslash to escape
+        # https://docs.sqlalchemy.org/en/13/core/sqlelement.html?highlight=text#sqlalchemy.sql.expression.text
+        for token in self.tokens:
+            _escape_colons(token)
+
+    @functools.cached_property
+    def fingerprint(self):
+        """
+        Returns statement with literals and placeholders replaced with ?, keywords capitalized, and whitespace
+        collapsed, so that statements that differ only in values have the same fingerprint.
+        """
+
+        # Lazily import
+        import sqlparse
+
+        fingerprint = []
+        for index, token in enumerate(self.tokens):
+            if index in self.placeholders or (
+                token.ttype in sqlparse.tokens.Literal and token.ttype != sqlparse.tokens.Literal.String.Symbol
+            ):  # Quoted identifiers (i.e., symbols) aren't values
+                fingerprint.append("?")
+            elif token.is_whitespace:
+                if fingerprint and fingerprint[-1] != " ":
+                    fingerprint.append(" ")
+            else:
+                fingerprint.append(token.normalized)
+        return "".join(fingerprint).strip()
+
+    def values(self, args, kwargs, escape):
+        """
+        Returns dict mapping indices of placeholders to values thereof, raising RuntimeError if
+        values do not match placeholders. Escapes values with escape for error messages.
+        """
+
+        # Infer paramstyle
+        paramstyle = self.paramstyle
+        placeholders = self.placeholders
 
         # If no placeholders
         if not paramstyle:
@@ -218,14 +2467,17 @@ class SQL(object):
             elif kwargs:
                 paramstyle = "named"
 
-        # In case of errors
-        _placeholders = ", ".join([str(tokens[index]) for index in placeholders])
-        _args = ", ".join([str(self._escape(arg)) for arg in args])
+        # Values to return
+        values = {}
 
-        # qmark
-        if paramstyle == "qmark":
+        # qmark or format
+        if paramstyle in ["qmark", "format"]:
             # Validate number of placeholders
             if len(placeholders) != len(args):
+                # In case of errors
+                _placeholders = ", ".join([str(self.tokens[index]) for index in placeholders])
+                _args = ", ".join([str(escape(arg)) for arg in args])
+
                 if len(placeholders) < len(args):
                     raise RuntimeError(
                         "fewer placeholders ({}) than values ({})".format(
@@ -239,19 +2491,19 @@ class SQL(object):
                         )
                     )
 
-            # Escape values
+            # Map values
             for i, index in enumerate(placeholders.keys()):
-                tokens[index] = self._escape(args[i])
+                values[index] = args[i]
 
         # numeric
         elif paramstyle == "numeric":
-            # Escape values
+            # Map values
             for index, i in placeholders.items():
                 if i >= len(args):
                     raise RuntimeError(
                         "missing value for placeholder (:{})".format(i + 1, len(args))
                     )
-                tokens[index] = self._escape(args[i])
+                values[index] = args[i]
 
             # Check if any values unused
             indices = set(range(len(args))) - set(placeholders.values())
@@ -259,57 +2511,34 @@ class SQL(object):
                 raise RuntimeError(
                     "unused {} ({})".format(
                         "value" if len(indices) == 1 else "values",
-                        ", ".join(
-                            [str(self._escape(args[index])) for index in indices]
-                        ),
+                        ", ".join([str(escape(args[index])) for index in indices]),
                     )
                 )
 
         # named
         elif paramstyle == "named":
-            # Escape values
+            # Map values
             for index, name in placeholders.items():
                 if name not in kwargs:
                     raise RuntimeError(
                         "missing value for placeholder (:{})".format(name)
                     )
-                tokens[index] = self._escape(kwargs[name])
+                values[index] = kwargs[name]
 
             # Check if any keys unused
             keys = kwargs.keys() - placeholders.values()
             if keys:
                 raise RuntimeError("unused values ({})".format(", ".join(keys)))
 
-        # format
-        elif paramstyle == "format":
-            # Validate number of placeholders
-            if len(placeholders) != len(args):
-                if len(placeholders) < len(args):
-                    raise RuntimeError(
-                        "fewer placeholders ({}) than values ({})".format(
-                            _placeholders, _args
-                        )
-                    )
-                else:
-                    raise RuntimeError(
-                        "more placeholders ({}) than values ({})".format(
-                            _placeholders, _args
-                        )
-                    )
-
-            # Escape values
-            for i, index in enumerate(placeholders.keys()):
-                tokens[index] = self._escape(args[i])
-
         # pyformat
         elif paramstyle == "pyformat":
-            # Escape values
+            # Map values
             for index, name in placeholders.items():
                 if name not in kwargs:
                     raise RuntimeError(
                         "missing value for placeholder (%{}s)".format(name)
                     )
-                tokens[index] = self._escape(kwargs[name])
+                values[index] = kwargs[name]
 
             # Check if any keys unused
             keys = kwargs.keys() - placeholders.values()
@@ -320,272 +2549,232 @@ class SQL(object):
                     )
                 )
 
-        # For SQL statements where a colon is required verbatim, as within an inline string, use a backslash to escape
-        # https://docs.sqlalchemy.org/en/13/core/sqlelement.html?highlight=text#sqlalchemy.sql.expression.text
-        for index, token in enumerate(tokens):
-            # In string literal
-            # https://www.sqlite.org/lang_keywords.html
-            if token.ttype in [
-                sqlparse.tokens.Literal.String,
-                sqlparse.tokens.Literal.String.Single,
-            ]:
-                token.value = re.sub(r"(^'|\s+):", r"\1\:", token.value)
-
-            # In identifier
-            # https://www.sqlite.org/lang_keywords.html
-            elif token.ttype == sqlparse.tokens.Literal.String.Symbol:
-                token.value = re.sub(r'(^"|\s+):', r"\1\:", token.value)
-
-        # Join tokens into statement
-        statement = "".join([str(token) for token in tokens])
-
-        # If no connection yet
-        if not hasattr(_data, self._name()):
-            # Connect to database
-            setattr(_data, self._name(), self._engine.connect())
+        return values
 
-        # Use this connection
-        connection = getattr(_data, self._name())
-
-        # Disconnect if/when a Flask app is torn down
-        try:
-            import flask
+    def bind(self, values, escape):
+        """Returns copy of statement's tokens, with placeholders replaced with values, escaped with escape."""
+        tokens = list(self.tokens)
+        for index, value in values.items():
+            tokens[index] = _escape_colons(escape(value))
+        return tokens
 
-            assert flask.current_app
+    def parameters(self, values):
+        """
+        Returns tuple of values in order of placeholders, for driver_sql, converted as by SQL._escape,
+        or None if any value cannot be bound by the driver (e.g., is a list).
+        """
 
-            def teardown_appcontext(exception):
-                self._disconnect()
+        # Lazily import
+        import datetime
 
-            if teardown_appcontext not in flask.current_app.teardown_appcontext_funcs:
-                flask.current_app.teardown_appcontext(teardown_appcontext)
-        except (ModuleNotFoundError, AssertionError):
-            pass
+        parameters = []
+        for index in self.placeholders:
+            value = values[index]
+            if isinstance(value, datetime.datetime):
+                value = value.strftime("%Y-%m-%d %H:%M:%S")
+            elif isinstance(value, datetime.date):
+                value = value.strftime("%Y-%m-%d")
+            elif isinstance(value, datetime.time):
+                value = value.strftime("%H:%M:%S")
+            elif isinstance(value, bool):
+                value = int(value)
+            elif isinstance(value, int):
+                if not -(2**63) <= value < 2**63:
+                    return None
+            elif value is not None and not isinstance(value, (bytes, float, str)):
+                return None
+            parameters.append(value)
+        return tuple(parameters)
+
+
+class _Rows(list):
+    """A list of rows, with a truncated attribute."""
+
+    truncated = False
+
+
+def _fetch(result, max_rows, max_bytes, size=1000):
+    """
+    Fetch result's rows as dicts, size at a time, stopping (and closing result) upon more than max_rows rows or
+    max_bytes bytes (approximately, per the lengths of values), if not None. Returns rows and whether truncated.
+    """
+
+    # If no limits
+    if max_rows is None and max_bytes is None:
+        return [dict(row) for row in result.mappings().all()], False
+
+    mappings = result.mappings()
+    rows = []
+    total = 0
+    while True:
+        batch = mappings.fetchmany(size)
+        if not batch:
+            return rows, False
+        for row in batch:
+            row = dict(row)
+            if max_bytes is not None:
+                total += sum(
+                    len(value) if isinstance(value, (bytes, memoryview, str)) else 8 for value in row.values()
+                )
+            if (max_rows is not None and len(rows) == max_rows) or (max_bytes is not None and total > max_bytes):
+                result.close()
+                return rows, True
+            rows.append(row)
 
-        # Catch SQLAlchemy warnings
-        with warnings.catch_warnings():
-            # Raise exceptions for warnings
-            warnings.simplefilter("error")
 
-            # Prepare, execute statement
-            try:
-                # Join tokens into statement, abbreviating binary data as <class 'bytes'>
-                _statement = "".join(
-                    [
-                        str(bytes)
-                        if token.ttype == sqlparse.tokens.Other
-                        else str(token)
-                        for token in tokens
-                    ]
-                )
+@functools.lru_cache(maxsize=256)
+def _parse(sql):
+    """Returns sql parsed as a _Statement, caching recently parsed statements."""
+    return _Statement(sql)
 
-                # Check for start of transaction
-                if command in ["BEGIN", "START", "VACUUM"]:  # cannot VACUUM from within a transaction
-                    self._autocommit = False
 
-                # Execute statement
-                if self._autocommit:
-                    connection.execute(sqlalchemy.text("BEGIN"))
-                result = connection.execute(sqlalchemy.text(statement))
-                if self._autocommit:
-                    connection.execute(sqlalchemy.text("COMMIT"))
+# Tasks for hooks' coroutines, referenced until done lest they be garbage-collected
+_tasks = set()
 
-                # Check for end of transaction
-                if command in ["COMMIT", "ROLLBACK", "VACUUM"]:  # cannot VACUUM from within a transaction
-                    self._autocommit = True
 
-                # Return value
-                ret = True
+def _call_hook(hook, event, redact):
+    """
+    Call hook with a copy of event, its values replaced with "?" if redact is True. If hook returns a
+    coroutine, schedules it in this thread's event loop, if running, else runs it to completion.
+    """
 
-                # If SELECT, return result set as list of dict objects
-                if command == "SELECT":
-                    # Coerce types
-                    rows = [dict(row) for row in result.mappings().all()]
-                    for row in rows:
-                        for column in row:
-                            # Coerce decimal.Decimal objects to float objects
-                            # https://groups.google.com/d/msg/sqlalchemy/0qXMYJvq8SA/oqtvMD9Uw-kJ
-                            if isinstance(row[column], decimal.Decimal):
-                                row[column] = float(row[column])
+    # Lazily import
+    import asyncio
+    import inspect
 
-                            # Coerce memoryview objects (as from PostgreSQL's bytea columns) to bytes
-                            elif isinstance(row[column], memoryview):
-                                row[column] = bytes(row[column])
+    event = dict(event)
+    if redact:
+        event["args"] = tuple("?" for arg in event["args"])
+        event["kwargs"] = {name: "?" for name in event["kwargs"]}
 
-                    # Rows to be returned
-                    ret = rows
+    # If coroutine
+    result = hook(event)
+    if inspect.iscoroutine(result):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            asyncio.run(result)
+        else:
+            task = loop.create_task(result)
+            _tasks.add(task)
+            task.add_done_callback(_tasks.discard)
+
+
+@contextlib.contextmanager
+def _driver_transaction(connection, enabled):
+    """
+    If enabled, yields with connection's DBAPI connection not in autocommit mode, so that its driver (e.g., psycopg2,
+    which allows server-side cursors only then) begins a transaction implicitly, which is committed upon exit (or
+    rolled back upon exception), whereupon autocommit mode is restored. Else just yields.
+    """
+    if not enabled:
+        yield
+        return
+    dbapi_connection = connection.connection.dbapi_connection
+    dbapi_connection.autocommit = False
+    try:
+        yield
+        dbapi_connection.commit()
+    finally:
+        try:
+            dbapi_connection.rollback()  # If not committed, else no-op
+        finally:
+            dbapi_connection.autocommit = True
 
-                # If INSERT, return primary key value for a newly inserted row (or None if none)
-                elif command == "INSERT":
-                    # If PostgreSQL
-                    if self._engine.url.get_backend_name() == "postgresql":
-                        # Return LASTVAL() or NULL, avoiding
-                        # "(psycopg2.errors.ObjectNotInPrerequisiteState) lastval is not yet defined in this session",
-                        # a la https://stackoverflow.com/a/24186770/5156190;
-                        # cf. https://www.psycopg.org/docs/errors.html re 55000
-                        result = connection.execute(
-                            sqlalchemy.text(
-                                """
-                            CREATE OR REPLACE FUNCTION _LASTVAL()
-                            RETURNS integer LANGUAGE plpgsql
-                            AS $$
-                            BEGIN
-                                BEGIN
-                                    RETURN (SELECT LASTVAL());
-                                EXCEPTION
-                                    WHEN SQLSTATE '55000' THEN RETURN NULL;
-                                END;
-                            END $$;
-                            SELECT _LASTVAL();
-                        """
-                            )
-                        )
-                        ret = result.first()[0]
 
-                    # If not PostgreSQL
-                    else:
-                        ret = result.lastrowid if result.rowcount == 1 else None
+def _close(connection):
+    """Close connection, as from another thread or upon its thread's exit, ignoring errors."""
+    try:
+        connection.close()
+    except Exception:  # E.g., sqlalchemy.exc.SQLAlchemyError, or ImportError if interpreter is exiting
+        pass
 
-                # If DELETE or UPDATE, return number of rows matched
-                elif command in ["DELETE", "UPDATE"]:
-                    ret = result.rowcount
 
-                # If CREATE VIEW, return True
-                elif command == "CREATE VIEW":
-                    ret = True
+def _abbreviate(parsed, tokens):
+    """Joins tokens, if any, into parsed's statement, abbreviating binary data as <class 'bytes'>, for logs."""
 
-            # If constraint violated
-            except sqlalchemy.exc.IntegrityError as e:
-                if self._autocommit:
-                    connection.execute(sqlalchemy.text("ROLLBACK"))
-                self._logger.error(termcolor.colored(_statement, "red"))
-                e = ValueError(e.orig)
-                e.__cause__ = None
-                raise e
+    # Lazily import
+    import sqlparse
 
-            # If user error
-            except (
-                sqlalchemy.exc.OperationalError,
-                sqlalchemy.exc.ProgrammingError,
-            ) as e:
-                self._disconnect()
-                self._logger.error(termcolor.colored(_statement, "red"))
-                e = RuntimeError(e.orig)
-                e.__cause__ = None
-                raise e
+    if tokens is None:
+        return parsed.sql
+    return "".join(
+        [str(bytes) if token.ttype == sqlparse.tokens.Other else str(token) for token in tokens]
+    )
 
-            # Return value
-            else:
-                self._logger.info(termcolor.colored(_statement, "green"))
-                if self._autocommit:  # Don't stay connected unnecessarily
-                    self._disconnect()
-                return ret
 
-    def _escape(self, value):
-        """
-        Escapes value using engine's conversion function.
+def _lastrowid(connection, result):
+    """Returns primary key value for a row newly inserted, per result, on connection (or None if none)."""
 
-        https://docs.sqlalchemy.org/en/latest/core/type_api.html#sqlalchemy.types.TypeEngine.literal_processor
+    # Lazily import
+    import sqlalchemy
+
+    # If PostgreSQL
+    if connection.dialect.name == "postgresql":
+        # Return LASTVAL() or NULL, avoiding
+        # "(psycopg2.errors.ObjectNotInPrerequisiteState) lastval is not yet defined in this session",
+        # a la https://stackoverflow.com/a/24186770/5156190;
+        # cf. https://www.psycopg.org/docs/errors.html re 55000
+        result = connection.execute(
+            sqlalchemy.text(
+                """
+            CREATE OR REPLACE FUNCTION _LASTVAL()
+            RETURNS integer LANGUAGE plpgsql
+            AS $$
+            BEGIN
+                BEGIN
+                    RETURN (SELECT LASTVAL());
+                EXCEPTION
+                    WHEN SQLSTATE '55000' THEN RETURN NULL;
+                END;
+            END $$;
+            SELECT _LASTVAL();
         """
+            )
+        )
+        return result.first()[0]
 
-        # Lazily import
-        import sqlparse
-
-        def __escape(value):
-            # Lazily import
-            import datetime
-            import sqlalchemy
+    # If not PostgreSQL
+    return result.lastrowid if result.rowcount == 1 else None
 
-            # bool
-            if isinstance(value, bool):
-                return sqlparse.sql.Token(
-                    sqlparse.tokens.Number,
-                    sqlalchemy.types.Boolean().literal_processor(self._engine.dialect)(
-                        value
-                    ),
-                )
 
-            # bytes
-            elif isinstance(value, bytes):
-                if self._engine.url.get_backend_name() in ["mysql", "sqlite"]:
-                    return sqlparse.sql.Token(
-                        sqlparse.tokens.Other, f"x'{value.hex()}'"
-                    )  # https://dev.mysql.com/doc/refman/8.0/en/hexadecimal-literals.html
-                elif self._engine.url.get_backend_name() == "postgresql":
-                    return sqlparse.sql.Token(
-                        sqlparse.tokens.Other, f"'\\x{value.hex()}'"
-                    )  # https://dba.stackexchange.com/a/203359
-                else:
-                    raise RuntimeError("unsupported value: {}".format(value))
+def _escape_colons(token):
+    """
+    Escapes colons in token, if a string literal or identifier, with backslashes, so that SQLAlchemy does not
+    mistake them for placeholders. Returns token.
 
-            # datetime.datetime
-            elif isinstance(value, datetime.datetime):
-                return sqlparse.sql.Token(
-                    sqlparse.tokens.String,
-                    sqlalchemy.types.String().literal_processor(self._engine.dialect)(
-                        value.strftime("%Y-%m-%d %H:%M:%S")
-                    ),
-                )
+    https://docs.sqlalchemy.org/en/13/core/sqlelement.html?highlight=text#sqlalchemy.sql.expression.text
+    """
 
-            # datetime.date
-            elif isinstance(value, datetime.date):
-                return sqlparse.sql.Token(
-                    sqlparse.tokens.String,
-                    sqlalchemy.types.String().literal_processor(self._engine.dialect)(
-                        value.strftime("%Y-%m-%d")
-                    ),
-                )
+    # Lazily import
+    import re
+    import sqlparse
 
-            # datetime.time
-            elif isinstance(value, datetime.time):
-                return sqlparse.sql.Token(
-                    sqlparse.tokens.String,
-                    sqlalchemy.types.String().literal_processor(self._engine.dialect)(
-                        value.strftime("%H:%M:%S")
-                    ),
-                )
+    # In string literal
+    # https://www.sqlite.org/lang_keywords.html
+    if token.ttype in [
+        sqlparse.tokens.Literal.String,
+        sqlparse.tokens.Literal.String.Single,
+    ]:
+        token.value = re.sub(r"(^'|\s+):", r"\1\:", token.value)
 
-            # float
-            elif isinstance(value, float):
-                return sqlparse.sql.Token(
-                    sqlparse.tokens.Number,
-                    sqlalchemy.types.Float().literal_processor(self._engine.dialect)(
-                        value
-                    ),
-                )
+    # In identifier
+    # https://www.sqlite.org/lang_keywords.html
+    elif token.ttype == sqlparse.tokens.Literal.String.Symbol:
+        token.value = re.sub(r'(^"|\s+):', r"\1\:", token.value)
 
-            # int
-            elif isinstance(value, int):
-                return sqlparse.sql.Token(
-                    sqlparse.tokens.Number,
-                    sqlalchemy.types.Integer().literal_processor(self._engine.dialect)(
-                        value
-                    ),
-                )
+    return token
 
-            # str
-            elif isinstance(value, str):
-                return sqlparse.sql.Token(
-                    sqlparse.tokens.String,
-                    sqlalchemy.types.String().literal_processor(self._engine.dialect)(
-                        value
-                    ),
-                )
 
-            # None
-            elif value is None:
-                return sqlparse.sql.Token(sqlparse.tokens.Keyword, sqlalchemy.null())
+def _user_exception(e):
+    """Returns sqlalchemy.exc.IntegrityError e as a ValueError, else (e.g., an OperationalError) as a RuntimeError."""
 
-            # Unsupported value
-            else:
-                raise RuntimeError("unsupported value: {}".format(value))
+    # Lazily import
+    import sqlalchemy
 
-        # Escape value(s), separating with commas as needed
-        if isinstance(value, (list, tuple)):
-            return sqlparse.sql.TokenList(
-                sqlparse.parse(", ".join([str(__escape(v)) for v in value]))
-            )
-        else:
-            return __escape(value)
+    e = ValueError(e.orig) if isinstance(e, sqlalchemy.exc.IntegrityError) else RuntimeError(e.orig)
+    e.__cause__ = None
+    return e
 
 
 def _parse_exception(e):
@@ -615,6 +2804,50 @@ def _parse_exception(e):
     return str(e)
 
 
+def _is_locked(e):
+    """
+    Infers whether sqlalchemy.exc.OperationalError is because database is locked or, for PostgreSQL and
+    MySQL, because of a serialization failure, deadlock, or lock timeout.
+
+    https://www.sqlite.org/rescode.html#busy
+    https://www.postgresql.org/docs/current/errcodes-appendix.html
+    https://dev.mysql.com/doc/mysql-errors/8.0/en/server-error-reference.html
+    """
+
+    # PostgreSQL
+    if getattr(e.orig, "pgcode", None) in ["40001", "40P01", "55P03"]:
+        return True
+
+    # MySQL
+    if e.orig.args and e.orig.args[0] in [1205, 1213]:
+        return True
+
+    # SQLite
+    return "database is locked" in str(e.orig) or "database table is locked" in str(e.orig)
+
+
+def _is_timeout(e):
+    """
+    Infers whether sqlalchemy.exc.OperationalError is because statement was interrupted after its timeout,
+    per SQL._timeout_after.
+
+    https://www.sqlite.org/rescode.html#interrupt
+    https://www.postgresql.org/docs/current/errcodes-appendix.html
+    https://dev.mysql.com/doc/mysql-errors/8.0/en/server-error-reference.html
+    """
+
+    # PostgreSQL
+    if getattr(e.orig, "pgcode", None) == "57014":
+        return True
+
+    # MySQL
+    if e.orig.args and e.orig.args[0] == 3024:
+        return True
+
+    # SQLite
+    return str(e.orig) == "interrupted"
+
+
 def _parse_placeholder(token):
     """Infers paramstyle, name from sqlparse.tokens.Name.Placeholder."""
 
@@ -0,0 +1,123 @@
+import io
+import logging
+import os
+import sys
+import unittest
+import unittest.mock
+
+sys.path.insert(0, "../src")
+
+from cs50.advisor import advise, capture, main, validate
+from cs50.sql import SQL
+
+
+class AdvisorTests(unittest.TestCase):
+
+    def setUp(self):
+        open("advisor.db", "w").close()
+        self.db = SQL("sqlite:///advisor.db")
+        self.db.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT, age INTEGER, city TEXT)")
+        self.db.execute("CREATE TABLE orders (id INTEGER PRIMARY KEY, user_id INTEGER, total REAL)")
+        self.db.execute(
+            "WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i < 19999) "
+            "INSERT INTO users (name, age, city) SELECT 'user' || i, i % 90, 'city' || (i % 50) FROM n"
+        )
+        self.db.execute("INSERT INTO orders (user_id, total) SELECT id, id / 10.0 FROM users")
+
+        # Capture workload
+        self.hook = capture(self.db, "advisor.jsonl")
+        for i in range(50):
+            self.db.execute("SELECT * FROM users WHERE name = ?", f"user{i}")
+            self.db.execute("SELECT * FROM users u WHERE u.city = :city AND u.age > 30 ORDER BY u.age", city="city1")
+        for i in range(5):
+            self.db.execute("SELECT * FROM users WHERE id = ?", i)
+            self.db.execute("SELECT u.name, o.total FROM users u JOIN orders o ON o.user_id = u.id WHERE u.id = ?", i)
+        self.assertRaises(RuntimeError, self.db.execute, "SELECT * FROM nonexistent")
+        self.db.remove_hook(self.hook)
+
+    def tearDown(self):
+        os.remove("advisor.db")
+        os.remove("advisor.jsonl")
+
+    def test_capture(self):
+        with open("advisor.jsonl") as file:
+            self.assertEqual(len(file.readlines()), 110)
+        self.db.execute("SELECT * FROM users WHERE id = 1")
+        with open("advisor.jsonl") as file:
+            self.assertEqual(len(file.readlines()), 110)
+
+        # Statements succeed even if capture file can't be written
+        hook = capture(self.db, ".")
+        try:
+            with self.assertLogs("cs50", logging.ERROR):
+                self.assertEqual(self.db.execute("UPDATE users SET age = 1 WHERE id = 1"), 1)
+        finally:
+            self.db.remove_hook(hook)
+
+    def test_advise(self):
+        proposals = advise("advisor.db", "advisor.jsonl")
+        self.assertEqual([proposal["statement"] for proposal in proposals], [
+            "CREATE INDEX idx_users_city_age ON users (city, age)",
+            "CREATE INDEX idx_users_name ON users (name)",
+            "CREATE INDEX idx_orders_user_id ON orders (user_id)",
+        ])
+        self.assertEqual(proposals[0]["executions"], 50)
+        self.assertEqual(proposals[0]["benefit"], 50 * 20000 * 2)
+        self.assertEqual(proposals[1]["benefit"], 50 * 20000)
+
+        # Once indexed, no longer proposed
+        self.db.execute("CREATE INDEX names ON users (name)")
+        self.assertNotIn("idx_users_name", [proposal["name"] for proposal in advise("advisor.db", "advisor.jsonl")])
+
+    def test_validate(self):
+        proposal = advise("advisor.db", "advisor.jsonl")[1]
+        result = validate("advisor.db", "advisor.jsonl", proposal, repeat=1)
+        self.assertTrue(result["used"])
+        self.assertLess(result["after"], result["before"])
+        self.assertEqual(self.db.indexes("users"), [])
+
+    def test_placeholders(self):
+        os.remove("advisor.jsonl")
+        self.hook = capture(self.db, "advisor.jsonl")
+        for i in range(5):
+            self.db.execute("SELECT * FROM users WHERE age=?", i)
+            self.db.execute("SELECT * FROM users WHERE city IN (?)", ["city1", "city2"])
+            self.db.execute("INSERT INTO orders (user_id, total) VALUES(?, ?)", i, 1.0)
+        self.db.remove_hook(self.hook)
+        proposals = advise("advisor.db", "advisor.jsonl")
+        self.assertEqual([proposal["statement"] for proposal in proposals], [
+            "CREATE INDEX idx_users_age ON users (age)",
+            "CREATE INDEX idx_users_city ON users (city)",
+        ])
+        for proposal in proposals:
+            self.assertTrue(validate("advisor.db", "advisor.jsonl", proposal, repeat=1)["used"])
+
+        # Not used, rather than raising, if statements can't be planned
+        proposal = dict(proposals[0], fingerprints=["SELECT * FROM nonexistent WHERE id=?"])
+        self.assertFalse(validate("advisor.db", "advisor.jsonl", proposal, repeat=1)["used"])
+
+    def test_quoted(self):
+        os.remove("advisor.jsonl")
+        self.hook = capture(self.db, "advisor.jsonl")
+        for i in range(5):
+            self.db.execute('SELECT "name" FROM "users" WHERE "age" = ?', i)
+            self.db.execute('SELECT "total" FROM "orders" AS "o" WHERE "o"."user_id" = ?', i)
+        self.db.remove_hook(self.hook)
+        self.assertEqual([proposal["statement"] for proposal in advise("advisor.db", "advisor.jsonl")], [
+            "CREATE INDEX idx_users_age ON users (age)",
+            "CREATE INDEX idx_orders_user_id ON orders (user_id)",
+        ])
+
+        # Statements that can't be planned are skipped, with a warning
+        self.db.execute("DROP TABLE orders")
+        with self.assertWarnsRegex(RuntimeWarning, "cannot plan"):
+            self.assertEqual(len(advise("advisor.db", "advisor.jsonl")), 1)
+
+    def test_main(self):
+        with unittest.mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            main(["sqlite:///advisor.db", "advisor.jsonl", "--top", "1"])
+        self.assertEqual(stdout.getvalue().splitlines()[0], "1. CREATE INDEX idx_users_city_age ON users (city, age);")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
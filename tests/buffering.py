@@ -0,0 +1,33 @@
+import os
+import subprocess
+import sys
+import unittest
+
+sys.path.insert(0, "../src")
+
+
+def run_python(code, buffering, stdin=""):
+    env = dict(os.environ, CS50_BUFFERING=buffering, PYTHONPATH=os.pathsep.join(sys.path))
+    return subprocess.run([sys.executable, "-c", f"import cs50\n{code}"], capture_output=True, env=env, input=stdin.encode(), check=True)
+
+
+class BufferingTests(unittest.TestCase):
+
+    def test_prompt(self):
+        for buffering in ["block", "line", "unbuffered"]:
+            stdout = run_python("print('Hello'); s = cs50.get_string('Name: '); print(f'Hi, {s}')", buffering, "David\n").stdout
+            self.assertEqual(stdout.decode(), "Hello\nName: Hi, David\n")
+
+    def test_exit(self):
+        for buffering in ["block", "line", "unbuffered"]:
+            stdout = run_python("for i in range(10000): print(i)", buffering).stdout
+            self.assertEqual(stdout.decode().split(), [str(i) for i in range(10000)])
+
+    def test_invalid(self):
+        result = run_python("print('Hello')", "foo")
+        self.assertEqual(result.stdout.decode(), "Hello\n")
+        self.assertIn("invalid buffering: foo", result.stderr.decode())
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
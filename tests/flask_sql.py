@@ -0,0 +1,136 @@
+import datetime
+import decimal
+import gc
+import logging
+import os
+import sys
+import unittest
+import weakref
+
+sys.path.insert(0, "../src")
+
+import flask
+
+import cs50.flask
+import cs50.sql
+from cs50.sql import SQL
+
+
+class FlaskTests(unittest.TestCase):
+
+    def setUp(self):
+        open("flask.db", "w").close()
+        self.db = SQL("sqlite:///flask.db")
+        self.db.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT)")
+        for name in ["foo", "bar", "baz"]:
+            self.db.execute("INSERT INTO users (name) VALUES(?)", name)
+        self.app = flask.Flask(__name__)
+
+    def test_instrument(self):
+        cs50.flask.instrument(self.app, repeats=2)
+
+        @self.app.route("/")
+        def index():
+            for id in [1, 2, 3]:
+                self.db.execute("SELECT name FROM users WHERE id = ?", id)
+            return "index"
+
+        @self.app.route("/none")
+        def none():
+            return "none"
+
+        with self.assertLogs(self.app.logger, logging.WARNING) as logs:
+            response = self.app.test_client().get("/")
+        self.assertRegex(response.headers["Server-Timing"], r'^db;dur=[\d.]+;desc="3 statements", db-slowest;dur=[\d.]+$')
+        self.assertIn("executed 3 times in one request (N+1?): SELECT name FROM users WHERE id = ?", logs.output[0])
+        self.assertNotIn("Server-Timing", self.app.test_client().get("/none").headers)
+
+        # Neither app nor observer outlives app
+        app = weakref.ref(self.app)
+        self.assertEqual(cs50.sql._after_execute, [cs50.flask._after_execute])
+        del self.app, index, none
+        gc.collect()
+        self.assertIsNone(app())
+        self.assertEqual(cs50.sql._after_execute, [])
+
+    def test_teardown(self):
+
+        @self.app.route("/")
+        def index():
+            self.db.execute("BEGIN")
+            self.db.execute("SELECT * FROM users")
+            self.assertEqual(self.db.statistics()["connections"], 1)
+            return "index"
+
+        for _ in range(3):
+            self.app.test_client().get("/")
+            self.assertEqual(self.db.statistics()["connections"], 0)
+            self.assertEqual(list(flask.appcontext_tearing_down.receivers_for(self.app)).count(self.db._teardown_appcontext), 1)
+
+    def test_loader(self):
+        users = self.db.loader("users")
+        statements = []
+        self.db.after_execute(lambda event: statements.append(event["sql"]))
+
+        @self.app.route("/")
+        def index():
+            return flask.render_template_string(
+                "{% for user in users %}{{ user.name }} {% endfor %}{{ loader.load(1).name }}",
+                loader=users,
+                users=users.load_many([3, 2, 1]),
+            )
+
+        self.assertEqual(self.app.test_client().get("/").get_data(as_text=True), "baz bar foo foo")
+        self.assertEqual(statements, ["SELECT * FROM users WHERE id IN (?)"])
+        self.app.test_client().get("/")
+        self.assertEqual(len(statements), 2)
+
+    def test_stream(self):
+        self.db.execute("CREATE TABLE files (id INTEGER PRIMARY KEY, data BLOB)")
+        self.db.execute("INSERT INTO files (data) VALUES(?)", b"\x00\xff")
+
+        @self.app.route("/users.json")
+        def users():
+            return cs50.flask.stream(self.db, "SELECT * FROM users WHERE id > ?", 0, size=2)
+
+        @self.app.route("/users.ndjson")
+        def users_ndjson():
+            return cs50.flask.stream(self.db, "SELECT name FROM users WHERE id > :id", id=1, format="ndjson")
+
+        @self.app.route("/files.json")
+        def files():
+            return cs50.flask.stream(self.db, "SELECT * FROM files WHERE id = 0")
+
+        @self.app.route("/files.ndjson")
+        def files_ndjson():
+            return cs50.flask.stream(self.db, "SELECT * FROM files", format="ndjson")
+
+        response = self.app.test_client().get("/users.json")
+        self.assertEqual(response.mimetype, "application/json")
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.get_json(), [{"id": 1, "name": "foo"}, {"id": 2, "name": "bar"}, {"id": 3, "name": "baz"}])
+        response = self.app.test_client().get("/users.ndjson")
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        self.assertEqual(response.get_data(as_text=True), '{"name":"bar"}\n{"name":"baz"}\n')
+        self.assertEqual(self.app.test_client().get("/files.json").get_data(as_text=True), "[]")
+        self.assertEqual(self.app.test_client().get("/files.ndjson").get_data(as_text=True), '{"id":1,"data":"AP8="}\n')
+        self.assertEqual(self.db._engine.pool.checkedout(), 0)
+
+        # Other types
+        self.assertEqual(cs50.flask._default(decimal.Decimal("1.5")), 1.5)
+        self.assertEqual(cs50.flask._default(datetime.date(2020, 1, 2)), "2020-01-02")
+        self.assertEqual(cs50.flask._default(datetime.datetime(2020, 1, 2, 3, 4, 5)), "2020-01-02T03:04:05")
+        self.assertRaises(TypeError, cs50.flask._default, object())
+
+        # Errors before responding
+        with self.app.test_request_context():
+            self.assertRaises(RuntimeError, cs50.flask.stream, self.db, "SELECT * FROM foo")
+            self.assertRaises(RuntimeError, cs50.flask.stream, self.db, "DELETE FROM users")
+            self.assertRaises(RuntimeError, cs50.flask.stream, self.db, "SELECT * FROM users", format="xml")
+
+    def tearDown(self):
+        os.remove("flask.db")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,77 @@
+import os
+import sys
+import threading
+import unittest
+import unittest.mock
+
+sys.path.insert(0, "../src")
+
+import cs50.sql
+from cs50.sql import SQL
+
+
+def run_threads(target, threads):
+    """Run target(i) in each of threads threads, returning their return values (or exceptions)."""
+    results = [None] * threads
+
+    def run(i):
+        try:
+            results[i] = target(i)
+        except Exception as e:
+            results[i] = e
+
+    workers = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return results
+
+
+class GroupCommitTests(unittest.TestCase):
+
+    def setUp(self):
+        open("group_commit.db", "w").close()
+        self.db = SQL("sqlite:///group_commit.db", group_commit=0.01)
+        self.db.execute("CREATE TABLE foo (id INTEGER PRIMARY KEY, val TEXT UNIQUE)")
+
+    def tearDown(self):
+        self.db._group.stop()
+        os.remove("group_commit.db")
+
+    def test_return_values(self):
+        ids = run_threads(lambda i: self.db.execute("INSERT INTO foo (val) VALUES(?)", str(i)), 20)
+        self.assertEqual(sorted(ids), list(range(1, 21)))
+        for i, id in enumerate(ids):
+            self.assertEqual(self.db.execute("SELECT val FROM foo WHERE id = ?", id), [{"val": str(i)}])
+        self.assertEqual(run_threads(lambda i: self.db.execute("UPDATE foo SET val = val || 'x' WHERE id = ?", i + 1), 5), [1] * 5)
+        self.assertEqual(self.db.execute("DELETE FROM foo"), 20)
+        statistics = self.db.statistics()
+        self.assertEqual(statistics["grouped"], 26)
+        self.assertLess(statistics["group_commits"], 26)
+
+    def test_exceptions(self):
+        results = run_threads(lambda i: self.db.execute("INSERT INTO foo (val) VALUES(?)", "bar" if i % 2 else str(i)), 10)
+        self.assertEqual(sum(isinstance(result, ValueError) for result in results), 4)
+        self.assertEqual(sum(isinstance(result, int) for result in results), 6)
+        self.assertRaises(RuntimeError, self.db.execute, "INSERT INTO bar (val) VALUES('baz')")
+        self.assertEqual(self.db.execute("SELECT COUNT(*) AS n FROM foo"), [{"n": 6}])
+
+    def test_writer_exceptions(self):
+        # Writes fail, rather than wait forever, if writer itself raises
+        with unittest.mock.patch.object(cs50.sql._GroupCommit, "_execute", side_effect=ZeroDivisionError):
+            results = run_threads(lambda i: self.db.execute("INSERT INTO foo (val) VALUES(?)", str(i)), 5)
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+        self.assertEqual(self.db.execute("INSERT INTO foo (val) VALUES('bar')"), 1)
+        self.assertEqual(self.db.execute("SELECT COUNT(*) AS n FROM foo"), [{"n": 1}])
+
+    def test_transaction(self):
+        self.db.execute("BEGIN")
+        self.db.execute("INSERT INTO foo (val) VALUES('bar')")
+        self.db.execute("ROLLBACK")
+        self.assertEqual(self.db.execute("SELECT * FROM foo"), [])
+        self.assertEqual(self.db.statistics()["grouped"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
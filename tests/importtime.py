@@ -0,0 +1,38 @@
+import os
+import re
+import subprocess
+import sys
+import unittest
+
+sys.path.insert(0, "../src")
+
+
+# Budget for `import cs50`, in microseconds, per `python -X importtime`
+BUDGET = 20000
+
+
+class ImportTimeTests(unittest.TestCase):
+
+    def run_python(self, *args):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        return subprocess.run([sys.executable, *args], capture_output=True, env=env, text=True)
+
+    def test_budget(self):
+        times = []
+        for _ in range(5):
+            stderr = self.run_python("-X", "importtime", "-c", "import cs50").stderr
+            times.append(int(re.search(r"^import time:\s+\d+ \|\s+(\d+) \| cs50$", stderr, re.MULTILINE).group(1)))
+        self.assertLess(min(times), BUDGET)
+
+    def test_lazy(self):
+        stdout = self.run_python("-c", "import cs50, sys; print(' '.join(sorted(sys.modules)))").stdout.split()
+        for module in ["cs50.sql", "flask", "logging", "sqlalchemy", "sqlparse", "termcolor"]:
+            self.assertNotIn(module, stdout)
+
+    def test_sql(self):
+        stdout = self.run_python("-c", "import cs50; print(cs50.SQL.__module__)").stdout
+        self.assertEqual(stdout.strip(), "cs50.sql")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,30 @@
+import os
+import subprocess
+import sys
+import unittest
+
+sys.path.insert(0, "../src")
+
+
+class ReaderTests(unittest.TestCase):
+
+    def run_python(self, code, stdin):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        return subprocess.run([sys.executable, "-c", f"import cs50\n{code}"], capture_output=True, env=env, input=stdin.encode(), check=True).stdout.decode().splitlines()
+
+    def test_get_ints(self):
+        self.assertEqual(self.run_python("print(cs50.get_ints().tolist())", "1 2\n-3 +4\r\nfoo 5 1.5\n6"), ["[1, 2, -3, 4, 5, 6]"])
+        self.assertEqual(self.run_python("print(cs50.get_ints(2).tolist(), cs50.get_ints(1).tolist())", "1 2 3 4\n"), ["[1, 2] [3]"])
+        self.assertEqual(self.run_python("print(cs50.get_ints())", "1 99999999999999999999\n"), ["[1, 99999999999999999999]"])
+        self.assertEqual(self.run_python("print(cs50.get_ints().tolist())", ""), ["[]"])
+
+    def test_get_floats(self):
+        self.assertEqual(self.run_python("print(cs50.get_floats().tolist())", "1.5 .5 5. -2\n+ . 1e5 nan\n"), ["[1.5, 0.5, 5.0, -2.0]"])
+
+    def test_read_table(self):
+        self.assertEqual(self.run_python("print([list(column) for column in cs50.read_table([str, int, float], sep=',')])", "foo,1,2.5\nbar,x,3\nbaz,3\n\nqux,4,5\n"), ["[['foo', 'qux'], [1, 4], [2.5, 5.0]]"])
+        self.assertEqual(self.run_python("print([list(column) for column in cs50.read_table([int, int])])", "1 2\n3 4\n"), ["[[1, 3], [2, 4]]"])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
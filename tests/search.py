@@ -0,0 +1,82 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, "../src")
+
+from cs50.sql import SQL
+
+
+class SearchTests(unittest.TestCase):
+
+    def setUp(self):
+        open("search.db", "w").close()
+        self.db = SQL("sqlite:///search.db")
+        self.db.execute("CREATE TABLE books (id INTEGER PRIMARY KEY, title TEXT, author TEXT, year INTEGER)")
+        for title, author, year in [
+            ("The Art of Computer Programming", "Donald Knuth", 1968),
+            ("Structure and Interpretation of Computer Programs", "Harold Abelson", 1985),
+            ("The C Programming Language", "Brian Kernighan", 1978),
+        ]:
+            self.db.execute("INSERT INTO books (title, author, year) VALUES(?, ?, ?)", title, author, year)
+        self.db.create_search_index("books", ["title", "author"])
+
+    def tearDown(self):
+        os.remove("search.db")
+
+    def test_search(self):
+        rows = self.db.search("books", "programming")
+        self.assertEqual([row["id"] for row in rows], [3, 1])
+        self.assertTrue(all(row["score"] < 0 for row in rows))
+        self.assertEqual(rows[0]["snippet"], "The C <mark>Programming</mark> Language")
+        self.assertEqual(rows[0]["year"], 1978)
+        self.assertEqual([row["id"] for row in self.db.search("books", "comp", snippet=False)], [1, 2])
+        self.assertNotIn("snippet", self.db.search("books", "knuth", snippet=False)[0])
+        self.assertEqual(len(self.db.search("books", "computer", limit=1)), 1)
+        self.assertEqual(self.db.search("books", "   "), [])
+
+        # Words are quoted, unless raw
+        self.assertEqual(self.db.search("books", 'knuth OR "'), [])
+        self.assertEqual(sorted(row["id"] for row in self.db.search("books", "knuth OR kernighan", raw=True)), [1, 3])
+        self.assertEqual([row["id"] for row in self.db.search("books", "author:harold", raw=True)], [2])
+        self.assertRaises(RuntimeError, self.db.search, "books", 'knuth "', raw=True)
+        self.assertRaises(RuntimeError, self.db.search, "books", "knuth", limit=0)
+
+    def test_triggers(self):
+        id = self.db.execute("INSERT INTO books (title, author, year) VALUES('Programming Pearls', 'Jon Bentley', 1986)")
+        self.assertEqual([row["id"] for row in self.db.search("books", "pearls")], [id])
+        self.db.execute("UPDATE books SET title = 'More Programming Pearls' WHERE id = ?", id)
+        self.assertEqual([row["title"] for row in self.db.search("books", "more")], ["More Programming Pearls"])
+        self.db.execute("UPDATE books SET id = 10 WHERE id = ?", id)
+        self.assertEqual([row["id"] for row in self.db.search("books", "pearls")], [10])
+        self.db.execute("DELETE FROM books WHERE id = 10")
+        self.assertEqual(self.db.search("books", "pearls"), [])
+        self.assertEqual(len(self.db.search("books", "programming")), 2)
+
+    def test_maintenance(self):
+        self.db.optimize_search_index("books")
+        self.db.execute("DROP TRIGGER books_search_insert")
+        self.db.execute("INSERT INTO books (title, author, year) VALUES('Programming Pearls', 'Jon Bentley', 1986)")
+        self.assertEqual(self.db.search("books", "pearls"), [])
+        self.db.rebuild_search_index("books")
+        self.assertEqual(len(self.db.search("books", "pearls")), 1)
+
+        # Drop and recreate, with other options
+        self.db.drop_search_index("books")
+        self.assertNotIn("books_search", self.db.tables())
+        self.db.execute("INSERT INTO books (title, author, year) VALUES('Code', 'Charles Petzold', 1999)")
+        self.db.create_search_index("books", "title", tokenize="porter unicode61", prefix=[2, 3])
+        self.assertEqual(sorted(row["id"] for row in self.db.search("books", "programs")), [1, 2, 3, 4])
+        self.assertEqual(self.db.search("books", "petzold"), [])
+
+        # Invalid
+        self.assertRaises(RuntimeError, self.db.create_search_index, "books", "title")
+        self.assertRaises(RuntimeError, self.db.create_search_index, "books", "foo")
+        self.assertRaises(RuntimeError, self.db.create_search_index, "books", [])
+        self.assertRaises(RuntimeError, self.db.create_search_index, "books; --", "title")
+        self.assertRaises(RuntimeError, self.db.create_search_index, "books", "author", tokenize="'")
+        self.assertRaises(RuntimeError, self.db.search, "authors", "knuth")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
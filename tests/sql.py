@@ -1,11 +1,15 @@
+import io
 import logging
 import os
+import shutil
 import sys
+import threading
 import unittest
 import warnings
 
 sys.path.insert(0, "../src")
 
+from cs50.sharded import ShardedSQL
 from cs50.sql import SQL
 
 
@@ -117,6 +121,104 @@ class SQLTests(unittest.TestCase):
             self.db.execute("INSERT INTO cs50(bin) VALUES(:bin)", bin=row["bin"])
         self.assertEqual(self.db.execute("SELECT id, bin FROM cs50"), rows)
 
+    def test_paginate(self):
+        for val in ["foo", "bar", "baz", "qux", "foo", "bar", "baz"]:
+            self.db.execute("INSERT INTO cs50 (val) VALUES(?)", val)
+
+        pages = list(self.db.paginate("SELECT id, val FROM cs50", page_size=3))
+        self.assertEqual([[row["id"] for row in page] for page in pages], [[1, 2, 3], [4, 5, 6], [7]])
+
+        pages = list(self.db.paginate("SELECT id FROM cs50 WHERE val != ?;", "qux", key="id DESC", page_size=2))
+        self.assertEqual([[row["id"] for row in page] for page in pages], [[7, 6], [5, 3], [2, 1]])
+
+        pages = list(self.db.paginate("SELECT id, val FROM cs50", key=["val", "id DESC"], page_size=4))
+        self.assertEqual([[row["id"] for row in page] for page in pages], [[6, 2, 7, 3], [5, 1, 4]])
+
+        self.assertEqual(list(self.db.paginate("SELECT id FROM cs50 WHERE id < 0")), [])
+        self.assertRaises(RuntimeError, list, self.db.paginate("SELECT val FROM cs50", page_size=1))
+        self.assertRaises(RuntimeError, list, self.db.paginate("SELECT id FROM cs50", key="id; DROP TABLE cs50"))
+
+    def test_prepare(self):
+        insert = self.db.prepare("INSERT INTO cs50 (val, bin) VALUES(?, ?)")
+        self.assertEqual(insert("foo", None), 1)
+        self.assertEqual(insert(":bar", b"\0"), 2)
+        self.assertRaises(RuntimeError, insert, "baz")
+
+        select = self.db.prepare("SELECT id, val, bin FROM cs50 WHERE val = :val")
+        self.assertEqual(select(val="foo"), [{"id": 1, "val": "foo", "bin": None}])
+        self.assertEqual(select(val=":bar"), [{"id": 2, "val": ":bar", "bin": b"\0"}])
+
+        select = self.db.prepare("SELECT id FROM cs50 WHERE id IN (?) ORDER BY id")
+        self.assertEqual(select([1, 2]), [{"id": 1}, {"id": 2}])
+
+        self.assertRaises(RuntimeError, self.db.prepare, "SELECT 1; SELECT 2")
+        self.assertRaises(RuntimeError, self.db.prepare, "SELECT ? AND :foo")
+
+    def test_hooks(self):
+        before, after = [], []
+        self.db.before_execute(before.append)
+
+        @self.db.after_execute(redact=True)
+        def hook(event):
+            after.append(event)
+
+        try:
+            self.db.execute("INSERT INTO cs50 (val) VALUES(?)", "foo")
+            self.db.execute("SELECT val FROM cs50 WHERE val = :val", val="foo")
+            self.assertRaises(RuntimeError, self.db.execute, "SELECT * FROM foo")
+        finally:
+            self.db.remove_hook(before.append)
+            self.db.remove_hook(hook)
+        self.db.execute("SELECT 1")
+
+        self.assertEqual([event["command"] for event in before], ["INSERT", "SELECT", "SELECT"])
+        self.assertEqual(before[0]["sql"], "INSERT INTO cs50 (val) VALUES(?)")
+        self.assertEqual(before[0]["args"], ("foo",))
+        self.assertEqual(len(after), 3)
+        self.assertEqual(after[0]["args"], ("?",))
+        self.assertEqual(after[0]["rowcount"], 1)
+        self.assertEqual(after[1]["kwargs"], {"val": "?"})
+        self.assertEqual(after[1]["rowcount"], 1)
+        self.assertIsNone(after[1]["exception"])
+        self.assertIsInstance(after[2]["exception"], RuntimeError)
+        self.assertGreaterEqual(after[2]["seconds"], 0)
+
+        # Coroutines
+        async def hook(event):
+            after.append(event["command"])
+
+        self.db.after_execute(hook)
+        try:
+            self.db.execute("SELECT 1")
+        finally:
+            self.db.remove_hook(hook)
+        self.assertEqual(after[-1], "SELECT")
+
+        # Exceptions in after hooks are logged, not raised
+        def hook(event):
+            raise ConnectionError("exporter is down")
+
+        self.db.after_execute(hook)
+        try:
+            with self.assertLogs("cs50", logging.ERROR) as logs:
+                self.assertEqual(self.db.execute("INSERT INTO cs50 (val) VALUES('bar')"), 2)
+        finally:
+            self.db.remove_hook(hook)
+        self.assertIn("exporter is down", logs.output[0])
+
+        # Scripts' statements, too
+        after.clear()
+        self.db.after_execute(after.append)
+        try:
+            self.db.execute_script("INSERT INTO cs50 (val) VALUES('baz'); DELETE FROM cs50 WHERE val = 'baz'")
+            self.assertRaises(ValueError, self.db.execute_script, "INSERT INTO cs50 (id) VALUES(1)")
+        finally:
+            self.db.remove_hook(after.append)
+        self.assertEqual([event["command"] for event in after], ["INSERT", "DELETE", "INSERT"])
+        self.assertEqual(after[1]["rowcount"], 1)
+        self.assertIsInstance(after[2]["exception"], ValueError)
+        self.assertEqual(self.db.execute("SELECT COUNT(*) AS n FROM cs50"), [{"n": 2}])
+
     def test_commit(self):
         self.db.execute("BEGIN")
         self.db.execute("INSERT INTO cs50 (val) VALUES('foo')")
@@ -182,6 +284,53 @@ class PostgresTests(SQLTests):
     def test_cte(self):
         self.assertEqual(self.db.execute("WITH foo AS ( SELECT 1 AS bar ) SELECT bar FROM foo"), [{"bar": 1}])
 
+    def test_result_limits(self):
+        from cs50.sql import ResultTooLarge
+        for i in range(5):
+            self.db.execute("INSERT INTO cs50 (val) VALUES(?)", "x" * 10)
+
+        # Via server-side cursor, within psycopg2's own transaction
+        self.assertEqual(len(self.db.execute("SELECT * FROM cs50", max_rows=5)), 5)
+        self.assertRaises(ResultTooLarge, self.db.execute, "SELECT * FROM cs50", max_rows=4)
+        self.assertRaises(ResultTooLarge, self.db.execute, "SELECT val FROM cs50", max_bytes=49)
+        rows = self.db.execute("SELECT val FROM cs50", max_rows=2, truncate=True)
+        self.assertEqual(len(rows), 2)
+        self.assertTrue(rows.truncated)
+        self.assertRaises(RuntimeError, self.db.execute, "SELECT * FROM nonexistent", max_rows=1)
+
+        # Autocommit restored thereafter
+        self.db.execute("INSERT INTO cs50 (val) VALUES('foo')")
+        self.assertEqual(SQL(f"postgresql://postgres:postgres@{os.getenv('POSTGRESQL_HOST')}/test").execute(
+            "SELECT COUNT(*) AS n FROM cs50"
+        ), [{"n": 6}])
+
+        # Within a transaction
+        self.db.execute("BEGIN")
+        self.db.execute("INSERT INTO cs50 (val) VALUES('bar')")
+        self.assertEqual(len(self.db.execute("SELECT * FROM cs50", max_rows=7)), 7)
+        self.db.execute("ROLLBACK")
+        self.assertEqual(self.db.execute("SELECT COUNT(*) AS n FROM cs50", max_rows=1), [{"n": 6}])
+
+    def test_stream(self):
+        for i in range(5):
+            self.db.execute("INSERT INTO cs50 (val) VALUES(?)", str(i))
+
+        # Via server-side cursor, within psycopg2's own transaction
+        batches = list(self.db._stream("SELECT val FROM cs50 ORDER BY id", (), {}, size=2))
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual(batches[0], [{"val": "0"}, {"val": "1"}])
+        stream = self.db._stream("SELECT val FROM cs50", (), {}, size=2)
+        next(stream)
+        stream.close()
+        self.assertRaises(RuntimeError, list, self.db._stream("SELECT * FROM nonexistent", (), {}))
+
+        # Autocommit restored thereafter
+        connection = self.db._engine.connect()
+        try:
+            self.assertTrue(connection.connection.dbapi_connection.autocommit)
+        finally:
+            connection.close()
+
 
 class SQLiteTests(SQLTests):
 
@@ -194,6 +343,17 @@ class SQLiteTests(SQLTests):
         self.db.execute("CREATE TABLE IF NOT EXISTS cs50 (id INTEGER PRIMARY KEY, val TEXT, bin BLOB)")
         self.db.execute("DELETE FROM cs50")
 
+    def test_fingerprint(self):
+        events = []
+        self.db.before_execute(events.append)
+        try:
+            self.db.execute("SELECT \"val\" FROM \"cs50\" WHERE id = ?", 1)
+            self.db.execute("SELECT \"bin\"   FROM cs50 WHERE \"id\" IN (1, 'foo')")
+        finally:
+            self.db.remove_hook(events.append)
+        self.assertEqual(events[0]["fingerprint"], "SELECT \"val\" FROM \"cs50\" WHERE id = ?")
+        self.assertEqual(events[1]["fingerprint"], "SELECT \"bin\" FROM cs50 WHERE \"id\" IN (?, ?)")
+
     def test_lastrowid(self):
         self.db.execute("CREATE TABLE foo(id INTEGER PRIMARY KEY AUTOINCREMENT, firstname TEXT, lastname TEXT)")
         self.assertEqual(self.db.execute("INSERT INTO foo (firstname, lastname) VALUES('firstname', 'lastname')"), 1)
@@ -332,10 +492,501 @@ class SQLiteTests(SQLTests):
     def test_cte(self):
         self.assertEqual(self.db.execute("WITH foo AS ( SELECT 1 AS bar ) SELECT bar FROM foo"), [{"bar": 1}])
 
+    def test_execute_script(self):
+        timings = self.db.execute_script("""
+            -- Schema
+            CREATE TABLE foo (id INTEGER PRIMARY KEY, val TEXT);
+            CREATE TABLE bar (n INTEGER); /* count of foo; */
+            INSERT INTO bar VALUES (0);
+            CREATE TRIGGER baz AFTER INSERT ON foo BEGIN
+                UPDATE bar SET n = n + 1;
+                UPDATE bar SET n = n + 0;
+            END;
+            INSERT INTO foo (val) VALUES ('qux; -- quux');
+            INSERT INTO foo (val) VALUES (':qux')
+        """)
+        self.assertEqual(len(timings), 6)
+        self.assertTrue(all(timing["seconds"] >= 0 for timing in timings))
+        self.assertEqual(self.db.execute("SELECT val FROM foo"), [{"val": "qux; -- quux"}, {"val": ":qux"}])
+        self.assertEqual(self.db.execute("SELECT n FROM bar"), [{"n": 2}])
+
+    def test_execute_script_rollback(self):
+        self.assertRaises(ValueError, self.db.execute_script, "INSERT INTO cs50 (id) VALUES (1); INSERT INTO cs50 (id) VALUES (1);")
+        self.assertRaises(RuntimeError, self.db.execute_script, "INSERT INTO cs50 (id) VALUES (1); INSERT INTO foo VALUES (1);")
+        self.assertEqual(self.db.execute("SELECT * FROM cs50"), [])
+
+    def test_readonly(self):
+        self.db.execute("INSERT INTO cs50 (val) VALUES('foo')")
+        for db in [SQL("sqlite:///test.db", readonly=True), SQL("sqlite:///test.db", immutable=True)]:
+            self.assertEqual(db.execute("SELECT val FROM cs50"), [{"val": "foo"}])
+            self.assertEqual(db._connect().exec_driver_sql("PRAGMA query_only").scalar(), 1)
+            self.assertGreater(db._connect().exec_driver_sql("PRAGMA mmap_size").scalar(), 0)
+            self.assertRaises(RuntimeError, db.execute, "INSERT INTO cs50 (val) VALUES('bar')")
+            self.assertRaises(RuntimeError, db.execute, "DROP TABLE cs50")
+            self.assertRaises(RuntimeError, db.execute, "PRAGMA user_version = 1")
+            self.assertEqual(len(db.execute_script("SELECT * FROM cs50; SELECT 1")), 2)
+            self.assertRaisesRegex(RuntimeError, "cannot write", db.execute_script, "SELECT 1; DELETE FROM cs50")
+            self.assertRaisesRegex(RuntimeError, "cannot write", db.upsert, "cs50", [{"id": 1, "val": "bar"}])
+            db.execute("BEGIN")
+            self.assertEqual(len(db.execute("SELECT * FROM cs50")), 1)
+            db.execute("COMMIT")
+            db._disconnect()
+        self.assertEqual(self.db.execute("SELECT val FROM cs50"), [{"val": "foo"}])
+
+    def test_memory(self):
+        db = SQL("sqlite:///:memory:")
+        db.execute("CREATE TABLE foo (id INTEGER PRIMARY KEY, val TEXT)")
+        db.execute("INSERT INTO foo (val) VALUES('bar')")
+
+        # Other threads' connections share database
+        rows = []
+        thread = threading.Thread(target=lambda: rows.extend(db.execute("SELECT val FROM foo")))
+        thread.start()
+        thread.join()
+        self.assertEqual(rows, [{"val": "bar"}])
+
+        # Concurrent readers and writers wait for, rather than fail because of, each other's locks
+        def read(i):
+            for _ in range(100):
+                db.execute("SELECT COUNT(*) AS n FROM foo")
+
+        def write(i):
+            for _ in range(100):
+                db.execute("INSERT INTO foo (val) VALUES(?)", str(i))
+
+        errors = []
+        def run(target, i):
+            try:
+                target(i)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(read, i)) for i in range(4)]
+        threads += [threading.Thread(target=run, args=(write, i)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(db.execute("SELECT COUNT(*) AS n FROM foo"), [{"n": 201}])
+        db.execute("DELETE FROM foo WHERE id > 1")
+
+        # Other instances don't
+        self.assertEqual(SQL("sqlite://").tables(), [])
+
+        # Snapshots
+        open("memory.db", "w").close()
+        try:
+            db.save_to("memory.db")
+            self.assertEqual(SQL("sqlite:///memory.db").execute("SELECT val FROM foo"), [{"val": "bar"}])
+            db.execute("DROP TABLE foo")
+            db.load_from("memory.db")
+            self.assertEqual(db.execute("SELECT val FROM foo"), [{"val": "bar"}])
+            self.assertRaises(RuntimeError, db.load_from, "nonexistent.db")
+        finally:
+            os.remove("memory.db")
+
+    def test_timeout(self):
+        from cs50.sql import StatementTimeout
+        runaway = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT COUNT(*) FROM c"
+        self.assertRaises(StatementTimeout, self.db.execute, runaway, timeout=0.1)
+        self.assertEqual(self.db.statistics()["timeouts"], 1)
+        self.assertRaises(RuntimeError, self.db.execute, "SELECT 1", timeout=0)
+
+        # Transaction is rolled back
+        self.db.execute("BEGIN")
+        self.db.execute("INSERT INTO cs50 (val) VALUES('foo')")
+        self.assertRaises(StatementTimeout, self.db.execute, runaway, timeout=0.1)
+        self.assertEqual(self.db.execute("SELECT * FROM cs50"), [])
+
+        # Default
+        db = SQL("sqlite:///test.db", timeout=0.1)
+        self.assertRaises(StatementTimeout, db.execute, runaway)
+        self.assertEqual(db.execute("SELECT COUNT(*) AS n FROM cs50", timeout=None), [{"n": 0}])
+
+    def test_result_limits(self):
+        from cs50.sql import ResultTooLarge
+        for i in range(5):
+            self.db.execute("INSERT INTO cs50 (val) VALUES(?)", "x" * 10)
+        self.assertEqual(len(self.db.execute("SELECT * FROM cs50", max_rows=5)), 5)
+        self.assertRaises(ResultTooLarge, self.db.execute, "SELECT * FROM cs50", max_rows=4)
+        self.assertRaises(ResultTooLarge, self.db.execute, "SELECT val FROM cs50", max_bytes=49)
+        self.assertRaises(RuntimeError, self.db.execute, "SELECT * FROM cs50", max_rows=-1)
+
+        rows = self.db.execute("SELECT id FROM cs50 ORDER BY id", max_rows=2, truncate=True)
+        self.assertEqual(rows, [{"id": 1}, {"id": 2}])
+        self.assertTrue(rows.truncated)
+        rows = self.db.execute("SELECT val FROM cs50", max_bytes=50, truncate=True)
+        self.assertEqual(len(rows), 5)
+        self.assertFalse(rows.truncated)
+
+        # Default
+        db = SQL("sqlite:///test.db", max_rows=3, truncate=True)
+        self.assertEqual(len(db.execute("SELECT * FROM cs50")), 3)
+        self.assertEqual(len(db.execute("SELECT * FROM cs50", max_rows=None)), 5)
+
+    def test_upsert(self):
+        self.db.execute("INSERT INTO cs50 (id, val) VALUES(1, 'foo')")
+        rows = [{"id": i, "val": str(i), "bin": None} for i in range(1, 6)]
+        self.assertEqual(self.db.upsert("cs50", rows, batch_size=2), {"inserted": 4, "updated": 1})
+        self.assertEqual(self.db.execute("SELECT val FROM cs50 WHERE id = 1"), [{"val": "1"}])
+        self.assertEqual(self.db.execute("SELECT COUNT(*) AS n FROM cs50"), [{"n": 5}])
+
+        # Update only some columns
+        rows = [{"id": 2, "val": "bar", "bin": b"\0"}, {"id": 6, "val": "baz", "bin": None}]
+        self.assertEqual(self.db.upsert("cs50", rows, update=["bin"]), {"inserted": 1, "updated": 1})
+        self.assertEqual(self.db.execute("SELECT val, bin FROM cs50 WHERE id = 2"), [{"val": "2", "bin": b"\0"}])
+        self.assertEqual(self.db.upsert("cs50", rows, update=[]), {"inserted": 0, "updated": 0})
+
+        # Unique key other than primary key
+        self.db.execute("CREATE TABLE foo (id INTEGER PRIMARY KEY, name TEXT UNIQUE, n INTEGER)")
+        rows = [{"name": "a", "n": 1}, {"name": "b", "n": 2}, {"name": "a", "n": 3}]
+        self.assertEqual(self.db.upsert("foo", rows, key="name"), {"inserted": 2, "updated": 0})
+        self.assertEqual(self.db.execute("SELECT name, n FROM foo ORDER BY name"), [{"name": "a", "n": 3}, {"name": "b", "n": 2}])
+
+        # Errors, rolled back
+        self.assertRaises(RuntimeError, self.db.upsert, "foo", [{"name": "c"}, {"n": 1}], key="name")
+        self.assertRaises(RuntimeError, self.db.upsert, "foo", [{"name": "c", "n": 1}], key="id")
+        self.assertRaises(RuntimeError, self.db.upsert, "foo", [{"name; --": "c"}], key="name")
+        self.assertRaises(ValueError, self.db.upsert, "foo", [{"id": 3, "name": "c"}, {"id": 4, "name": "a"}])
+        self.assertEqual(len(self.db.execute("SELECT * FROM foo")), 2)
+
+        # Hooks, for each statement
+        events = []
+        self.db.after_execute(events.append)
+        try:
+            self.db.upsert("foo", [{"name": "c", "n": 4}, {"name": "d", "n": 5}], key="name", batch_size=1)
+            self.assertRaises(ValueError, self.db.upsert, "foo", [{"id": 3, "name": "a"}])
+        finally:
+            self.db.remove_hook(events.append)
+        self.assertEqual([event["command"] for event in events], ["SELECT", "INSERT"] * 3)
+        self.assertEqual(events[1]["rowcount"], 1)
+        self.assertIsInstance(events[-1]["exception"], ValueError)
+
+    def test_open_blob(self):
+        from cs50.sql import _ChunkedBlob
+        data = bytes(range(256)) * 1024
+        id = self.db.execute("INSERT INTO cs50 (bin) VALUES(?)", data)
+        self.assertEqual(self.db.execute("SELECT bin FROM cs50"), [{"bin": data}])
+        for open_blob in [
+            self.db.open_blob,
+            lambda table, column, rowid, mode="r": _ChunkedBlob(
+                self.db._engine.connect(), True, table, column, "rowid", rowid, mode == "w"
+            ),
+        ]:
+            with open_blob("cs50", "bin", id) as blob:
+                buffer = bytearray(1000)
+                self.assertEqual(blob.readinto(buffer), 1000)
+                self.assertEqual(buffer, data[:1000])
+                self.assertEqual(blob.seek(-6, 2), len(data) - 6)
+                self.assertEqual(blob.read(), data[-6:])
+                self.assertEqual(blob.read(), b"")
+                self.assertRaises(io.UnsupportedOperation, blob.write, b"foo")
+            with open_blob("cs50", "bin", id, "w") as blob:
+                blob.seek(1)
+                self.assertEqual(blob.write(b"foo"), 3)
+                blob.seek(-1, 2)
+                self.assertRaises(RuntimeError, blob.write, b"foo")
+            self.assertEqual(self.db.execute("SELECT bin FROM cs50")[0]["bin"][:5], b"\x00foo\x04")
+            self.db.execute("UPDATE cs50 SET bin = ?", data)
+        self.assertRaises(RuntimeError, self.db.open_blob, "cs50", "bin", id + 1)
+        self.assertRaises(RuntimeError, self.db.open_blob, "cs50", "bin", id, "x")
+
+    def test_engines(self):
+        from cs50.sql import _tested
+        self.assertIs(SQL("sqlite:///test.db")._engine, self.db._engine)
+        self.assertIsNot(SQL("sqlite:///test.db", busy_timeout=1)._engine, self.db._engine)
+        self.assertIsNot(SQL("sqlite:///:memory:")._engine, SQL("sqlite:///:memory:")._engine)
+        self.assertRaises(RuntimeError, SQL, "sqlite:///test.db", check="foo")
+
+        # Lazy, background, and warm
+        for check in ["lazy", "background"]:
+            open("engines.db", "w").close()
+            try:
+                db = SQL("sqlite:///engines.db", check=check, warm=2)
+                if check == "lazy":
+                    self.assertNotIn(db._engine, _tested)
+                self.assertEqual(db.execute("SELECT 1 AS n"), [{"n": 1}])
+                self.assertIn(db._engine, _tested)
+                self.assertEqual(db._engine.pool.checkedin(), 2)
+
+                # Upon first use by several threads at once
+                db = SQL("sqlite:///engines.db", check=check)
+                results = [None] * 8
+                def select(i):
+                    results[i] = db.execute("SELECT 1 AS n")
+                threads = [threading.Thread(target=select, args=(i,)) for i in range(len(results))]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                self.assertEqual(results, [[{"n": 1}]] * len(results))
+                self.assertIsNone(db._check)
+            finally:
+                os.remove("engines.db")
+
+        # Not reused for a since replaced file
+        open("engines.db", "w").close()
+        try:
+            self.assertIsNot(SQL("sqlite:///engines.db")._engine, db._engine)
+        finally:
+            os.remove("engines.db")
+
+    def test_connections(self):
+        self.db.execute("CREATE TABLE foo (id INTEGER PRIMARY KEY, val TEXT)")
+        self.assertEqual(self.db.statistics()["connections"], 0)
+
+        # Connection of a thread that exits within a transaction is closed (and its transaction rolled back)
+        db = SQL("sqlite:///test.db")
+        def transact():
+            db.execute("BEGIN")
+            db.execute("INSERT INTO foo (val) VALUES('bar')")
+            self.assertEqual(db.statistics()["connections_per_thread"], {"transact": 1})
+        thread = threading.Thread(target=transact, name="transact")
+        thread.start()
+        thread.join()
+        self.assertEqual(db.statistics()["connections"], 0)
+        self.assertEqual(db._engine.pool.checkedout(), 0)
+        self.assertEqual(db.execute("SELECT * FROM foo"), [])
+        self.assertEqual(db.execute("INSERT INTO foo (val) VALUES('baz')"), 1)
+        self.assertEqual(db.statistics()["connections"], 0)
+        db.execute("DELETE FROM foo")
+
+        # Close closes every thread's connection
+        started, done = threading.Event(), threading.Event()
+        def wait():
+            db.execute("BEGIN")
+            started.set()
+            done.wait()
+        thread = threading.Thread(target=wait)
+        thread.start()
+        started.wait()
+        self.assertEqual(db.statistics()["connections"], 1)
+
+        # Other threads aren't within that transaction
+        self.assertEqual(db.execute("SELECT * FROM foo"), [])
+        self.assertEqual(db.statistics()["connections"], 1)
+        with db:
+            pass
+        self.assertEqual(db.statistics()["connections"], 0)
+        self.assertEqual(db._engine.pool.checkedout(), 0)
+        done.set()
+        thread.join()
+        self.assertEqual(db.execute("INSERT INTO foo (val) VALUES('baz')"), 1)
+
+    def test_loader(self):
+        self.db.execute("CREATE TABLE foo (id INTEGER PRIMARY KEY, val TEXT)")
+        for val in ["bar", "baz", "qux"]:
+            self.db.execute("INSERT INTO foo (val) VALUES(?)", val)
+        statements = []
+        self.db.after_execute(lambda event: statements.append(event["sql"]))
+
+        # One SELECT for all rows loaded before first access
+        loader = self.db.loader("foo", batch_size=2)
+        rows = [loader.load(id) for id in [3, 1, 4, 3]]
+        self.assertEqual(statements, [])
+        self.assertEqual(rows[0]["val"], "qux")
+        self.assertEqual(statements, ["SELECT * FROM foo WHERE id IN (?)"] * 2)
+        self.assertEqual(rows[1], {"id": 1, "val": "bar"})
+        self.assertEqual(dict(rows[3]), {"id": 3, "val": "qux"})
+        self.assertFalse(rows[2])
+        self.assertRaises(KeyError, lambda: rows[2]["val"])
+        self.assertEqual(len(statements), 2)
+
+        # Not cached outside of Flask requests
+        self.assertEqual([row["val"] for row in loader.load_many([2, 3])], ["baz", "qux"])
+        self.assertEqual(len(statements), 3)
+
+        # By another key
+        self.assertEqual(self.db.loader("foo", key="val").load("baz")["id"], 2)
+        self.assertRaises(RuntimeError, self.db.loader, "foo; DROP TABLE foo")
+        self.assertRaises(RuntimeError, self.db.loader, "foo", batch_size=0)
+
+    def test_introspection(self):
+        self.db.execute("CREATE TABLE foo (id INTEGER PRIMARY KEY, val TEXT NOT NULL DEFAULT 'bar')")
+        self.db.execute("CREATE UNIQUE INDEX foo_val ON foo (val)")
+        self.assertEqual(sorted(self.db.tables()), ["cs50", "foo"])
+        self.assertEqual(self.db.columns("foo"), [
+            {"name": "id", "type": "INTEGER", "nullable": True, "default": None},
+            {"name": "val", "type": "TEXT", "nullable": False, "default": "'bar'"}
+        ])
+        self.assertEqual(self.db.primary_key("foo"), ["id"])
+        self.assertEqual(self.db.indexes("foo"), [{"name": "foo_val", "columns": ["val"], "unique": True}])
+        self.assertRaises(RuntimeError, self.db.columns, "bar")
+
+        self.db.execute("ALTER TABLE foo ADD COLUMN baz INTEGER")
+        self.assertEqual([column["name"] for column in self.db.columns("foo")], ["id", "val", "baz"])
+        self.db.execute("DROP INDEX foo_val")
+        self.assertEqual(self.db.indexes("foo"), [])
+
+    def test_execute_script_file(self):
+        with open("script.sql", "w") as file:
+            file.write("CREATE TABLE foo (id INTEGER);\nINSERT INTO foo VALUES (1);\n")
+        try:
+            self.db.execute_script("script.sql")
+        finally:
+            os.remove("script.sql")
+        self.assertEqual(self.db.execute("SELECT id FROM foo"), [{"id": 1}])
+
+
+class SQLiteReplicaTests(unittest.TestCase):
+
+    def setUp(self):
+        open("primary.db", "w").close()
+        SQL("sqlite:///primary.db").execute("CREATE TABLE cs50 (id INTEGER PRIMARY KEY, val TEXT)")
+        for replica in ["replica1.db", "replica2.db"]:
+            shutil.copyfile("primary.db", replica)
+            SQL(f"sqlite:///{replica}").execute("INSERT INTO cs50 (val) VALUES(?)", replica)
+        self.db = SQL("sqlite:///primary.db", replicas=["sqlite:///replica1.db", "sqlite:///replica2.db"])
+        self.db.execute("INSERT INTO cs50 (val) VALUES('primary')")
+
+    def test_round_robin(self):
+        self.assertEqual(self.db.execute("SELECT val FROM cs50"), [{"val": "replica1.db"}])
+        self.assertEqual(self.db.execute("SELECT val FROM cs50"), [{"val": "replica2.db"}])
+        self.assertEqual(self.db.execute("SELECT val FROM cs50"), [{"val": "replica1.db"}])
+
+    def test_least_busy(self):
+        db = SQL("sqlite:///primary.db", replicas=["sqlite:///replica1.db", "sqlite:///replica2.db"], balance="least_busy")
+        self.assertIn(db.execute("SELECT val FROM cs50"), [[{"val": "replica1.db"}], [{"val": "replica2.db"}]])
+
+    def test_route(self):
+        self.assertEqual(self.db.execute("SELECT val FROM cs50", route="primary"), [{"val": "primary"}])
+        self.assertRaises(RuntimeError, self.db.execute, "INSERT INTO cs50 (val) VALUES('foo')", route="replica")
+        self.assertRaises(RuntimeError, self.db.execute, "SELECT val FROM cs50", route="foo")
+        self.assertEqual(self.db.execute("SELECT val FROM cs50 WHERE val = :route", route="replica1.db"), [{"val": "replica1.db"}])
+
+    def test_transaction(self):
+        self.db.execute("BEGIN")
+        self.assertEqual(self.db.execute("SELECT val FROM cs50"), [{"val": "primary"}])
+        self.assertEqual(self.db.execute("SELECT val FROM cs50", route="replica"), [{"val": "replica1.db"}])
+        self.db.execute("COMMIT")
+        self.assertEqual(self.db.execute("SELECT val FROM cs50"), [{"val": "replica2.db"}])
+
+        # Error on replica doesn't roll back primary's transaction
+        self.db.execute("BEGIN")
+        self.db.execute("INSERT INTO cs50 (val) VALUES('foo')")
+        self.assertRaises(RuntimeError, self.db.execute, "SELECT * FROM nonexistent", route="replica")
+        self.db.execute("COMMIT")
+        self.assertEqual(self.db.execute("SELECT val FROM cs50 WHERE val = 'foo'", route="primary"), [{"val": "foo"}])
+
+    def tearDown(self):
+        for path in ["primary.db", "replica1.db", "replica2.db"]:
+            os.remove(path)
+
+
+class SQLiteContentionTests(unittest.TestCase):
+
+    def setUp(self):
+        open("contention.db", "w").close()
+        SQL("sqlite:///contention.db").execute("CREATE TABLE cs50 (id INTEGER PRIMARY KEY, val TEXT)")
+
+    def contend(self, db, threads=8, inserts=25):
+        """Returns number of failed INSERTs by threads."""
+        failures = []
+
+        def insert():
+            for i in range(inserts):
+                try:
+                    db.execute("INSERT INTO cs50 (val) VALUES(?)", "foo")
+                except RuntimeError:
+                    failures.append(i)
+
+        threads = [threading.Thread(target=insert) for _ in range(threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return len(failures)
+
+    def test_retries(self):
+        without = self.contend(SQL("sqlite:///contention.db", busy_timeout=0))
+        db = SQL("sqlite:///contention.db", busy_timeout=0, retries=50, backoff=0.001)
+        self.assertEqual(self.contend(db), 0)
+        self.assertGreater(without, 0)
+        self.assertEqual(db.execute("SELECT COUNT(*) AS n FROM cs50")[0]["n"], 8 * 25 * 2 - without)
+        self.assertEqual(db.statistics()["lock_failures"], 0)
+        self.assertGreater(db.statistics()["retries"], 0)
+
+    def tearDown(self):
+        os.remove("contention.db")
+
+
+class ShardedSQLiteTests(unittest.TestCase):
+
+    def setUp(self):
+        for i in range(3):
+            open(f"shard{i}.db", "w").close()
+        self.db = ShardedSQL([f"sqlite:///shard{i}.db" for i in range(3)])
+        self.db.execute("CREATE TABLE cs50 (id INTEGER PRIMARY KEY, val TEXT)")
+        for id in range(1, 11):
+            self.db.execute("INSERT INTO cs50 (id, val) VALUES(?, ?)", id, str(id % 4), shard_key=id)
+
+    def tearDown(self):
+        self.db.close()
+        for i in range(3):
+            os.remove(f"shard{i}.db")
+
+    def test_shard_key(self):
+        self.assertEqual(self.db.execute("SELECT id FROM cs50 ORDER BY id", shard_key=1), [{"id": 1}, {"id": 4}, {"id": 7}, {"id": 10}])
+        self.assertEqual(self.db.shard(2).execute("SELECT COUNT(*) AS n FROM cs50"), [{"n": 3}])
+        self.assertRaises(RuntimeError, self.db.execute, "INSERT INTO cs50 (val) VALUES('foo')")
+        self.assertEqual(self.db.execute("SELECT id FROM cs50 WHERE id = :shard_key", shard_key=5), [{"id": 5}])
+        self.assertEqual(self.db.execute("INSERT INTO cs50 (id, val) VALUES(:shard_key, 'foo')", shard_key=11), 11)
+        self.assertEqual(self.db.shard(11).execute("SELECT val FROM cs50 WHERE id = 11"), [{"val": "foo"}])
+        db = ShardedSQL(["sqlite:///shard0.db", "sqlite:///shard1.db"], shard=lambda key: 0 if key < "m" else 1)
+        self.assertIs(db.shard("foo"), db._shards[0])
+        self.assertIs(db.shard("qux"), db._shards[1])
+
+    def test_scatter(self):
+        self.assertEqual(len(self.db.execute("SELECT * FROM cs50")), 10)
+        self.assertEqual(self.db.execute("SELECT id FROM cs50 ORDER BY id DESC LIMIT 3"), [{"id": 10}, {"id": 9}, {"id": 8}])
+        self.assertEqual(self.db.execute("SELECT id FROM cs50 ORDER BY id LIMIT 2 OFFSET 4"), [{"id": 5}, {"id": 6}])
+        self.assertEqual(self.db.execute("SELECT id FROM cs50 ORDER BY id LIMIT 4, 2"), [{"id": 5}, {"id": 6}])
+        self.assertEqual(
+            [row["id"] for row in self.db.execute("SELECT id, val FROM cs50 WHERE id > ? ORDER BY val DESC, cs50.id ASC", 2)],
+            [3, 7, 6, 10, 5, 9, 4, 8],
+        )
+        self.assertRaises(RuntimeError, self.db.execute, "SELECT id FROM cs50 ORDER BY LENGTH(val)")
+        self.assertRaises(RuntimeError, self.db.execute, "SELECT id FROM cs50 LIMIT ?", 1)
+        self.assertEqual(len(self.db.execute("SELECT id FROM cs50 WHERE id IN (SELECT MAX(id) FROM cs50)")), 3)
+        self.assertEqual(len(self.db.execute("SELECT id FROM cs50 UNION ALL SELECT id FROM cs50")), 20)
+        for sql in [
+            "SELECT COUNT(*) AS n FROM cs50",
+            "SELECT max(id) + 1 AS n FROM cs50",
+            "SELECT DISTINCT val FROM cs50",
+            "SELECT val FROM cs50 GROUP BY val",
+            "SELECT id, ROW_NUMBER() OVER (ORDER BY id) AS n FROM cs50",
+            "SELECT val FROM cs50 UNION SELECT val FROM cs50",
+        ]:
+            self.assertRaises(RuntimeError, self.db.execute, sql)
+        self.assertEqual(self.db.execute("SELECT COUNT(*) AS n FROM cs50", shard_key=1), [{"n": 4}])
+        self.assertEqual(self.db.execute("UPDATE cs50 SET val = 'foo' WHERE id > 5"), 5)
+        self.assertEqual(self.db.execute("DELETE FROM cs50"), 10)
+
+        # Threads stopped upon close, restarted upon next use
+        executor = self.db._executor
+        with self.db:
+            pass
+        self.assertIsNone(self.db._executor)
+        self.assertRaises(RuntimeError, executor.submit, print)
+        self.assertEqual(self.db.execute("SELECT * FROM cs50"), [])
+
+    def test_transaction(self):
+        shard = self.db.shard(1)
+        shard.execute("BEGIN")
+        self.assertRaises(RuntimeError, self.db.execute, "SELECT * FROM cs50")
+        self.assertRaises(RuntimeError, self.db.execute, "COMMIT")
+        self.db.execute("DELETE FROM cs50", shard_key=1)
+        self.db.execute("ROLLBACK", shard_key=1)
+        self.assertEqual(len(self.db.execute("SELECT * FROM cs50")), 10)
+
 
 if __name__ == "__main__":
     suite = unittest.TestSuite([
         unittest.TestLoader().loadTestsFromTestCase(SQLiteTests),
+        unittest.TestLoader().loadTestsFromTestCase(SQLiteReplicaTests),
+        unittest.TestLoader().loadTestsFromTestCase(SQLiteContentionTests),
+        unittest.TestLoader().loadTestsFromTestCase(ShardedSQLiteTests),
         unittest.TestLoader().loadTestsFromTestCase(MySQLTests),
         unittest.TestLoader().loadTestsFromTestCase(PostgresTests)
     ])